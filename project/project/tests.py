@@ -1,3 +1,1511 @@
-from django.test import TestCase  # noqa
+import json
+import os
+import tempfile
+from datetime import timedelta
+from io import BytesIO, StringIO
+from types import SimpleNamespace
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.http import http_date
+from filer.models import Image as FilerImage
+from PIL import Image as PILImage
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from funicular_up.broker import CHANNEL, notify_entries
+from funicular_up.geocoding import GEOCODE_MISS_TTL, geocode, get_cached
+from funicular_up.models import (
+    PENDING,
+    Blob,
+    Entry,
+    Folder,
+    GeocodedAddress,
+    Job,
+    Transition,
+    Upload,
+    delete_unused_image,
+    file_digest,
+    increasing_subsequence,
+    lock_file,
+    place_entries,
+    show_folder_tree,
+)
+from funicular_up.sendfile import get_range, serve_file
+from funicular_up.tasks import (
+    JOB_KEEP,
+    JOB_MAX_ATTEMPTS,
+    JOB_TIMEOUT,
+    TASKS,
+    beat_jobs,
+    claim_jobs,
+    enqueue,
+    fail_job,
+    make_thumbnails,
+    prune_jobs,
+    prune_transitions,
+    release_jobs,
+    run_job,
+    stage_file,
+)
+from funicular_up.views import (
+    BATCH_MAX_SIZE,
+    CHANGES_SETTLE,
+    ENTRY_PAGE_SIZE,
+    MAP_MAX_ZOOM,
+    decode_cursor,
+    encode_cursor,
+    encode_position,
+    entry_page,
+)
+
+
+class IndexUsageTest(TestCase):
+    """Query plans of the hot paths use the designed indexes, on a volume
+    of data where full scans would be costly"""
+
+    @classmethod
+    def setUpTestData(cls):
+        parents = Folder.objects.bulk_create(
+            Folder(name=f"parent-{i}") for i in range(20)
+        )
+        cls.folders = Folder.objects.bulk_create(
+            Folder(name=f"folder-{i}", parent=parent)
+            for parent in parents
+            for i in range(10)
+        )
+        # 20000 entries, 2% of them pending
+        Entry.objects.bulk_create(
+            Entry(
+                folder=folder,
+                position=1024 * i,
+                status="UP" if i % 50 == 0 else "DW",
+            )
+            for folder in cls.folders
+            for i in range(100)
+        )
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+
+    def assertUsesIndex(self, queryset, index):
+        self.assertIn(index, queryset.explain())
+
+    @skipUnless(
+        connection.vendor == "postgresql",
+        "SQLite can't match partial indexes against bound parameters",
+    )
+    def test_pending_entries(self):
+        queryset = Entry.objects.filter(status__in=PENDING).order_by("id")
+        self.assertUsesIndex(queryset, "entry_pending_idx")
+
+    def test_folder_entries_by_status(self):
+        queryset = Entry.objects.filter(folder=self.folders[0], status="DW")
+        self.assertUsesIndex(queryset, "entry_folder_status_idx")
+
+    def test_folder_entry_page(self):
+        queryset = Entry.objects.filter(folder=self.folders[0])[:48]
+        self.assertUsesIndex(queryset, "entry_folder_position_idx")
+
+    def test_subfolders(self):
+        queryset = Folder.objects.filter(parent=self.folders[0].parent_id)
+        self.assertUsesIndex(queryset.order_by("date", "name"), "folder_order_idx")
+
+
+@override_settings(FILE_UPLOAD_TEMP_DIR=tempfile.mkdtemp())
+class UploadChunkTest(TestCase):
+    """Chunks are written only at the offset reached"""
+
+    def setUp(self):
+        folder = Folder.objects.create(name="folder")
+        entry = Entry.objects.create(folder=folder, status="RQ")
+        self.upload = Upload.objects.create(
+            entry=entry, name="image.jpg", size=10, checksum="0" * 64
+        )
+
+    def tearDown(self):
+        self.upload.delete()
+
+    def assertPartFile(self, content):
+        self.upload.refresh_from_db()
+        self.assertEqual(self.upload.offset, len(content))
+        self.assertEqual(self.upload.path.read_bytes(), content)
+
+    def test_chunks_in_order(self):
+        self.assertEqual(self.upload.write_chunk(0, BytesIO(b"abcd"), 4), 4)
+        self.assertEqual(self.upload.write_chunk(4, BytesIO(b"efghij"), 6), 6)
+        self.assertPartFile(b"abcdefghij")
+
+    def test_chunk_not_at_offset(self):
+        self.upload.write_chunk(0, BytesIO(b"abcd"), 4)
+        self.assertIsNone(self.upload.write_chunk(2, BytesIO(b"xx"), 2))
+        self.assertIsNone(self.upload.write_chunk(6, BytesIO(b"xx"), 2))
+        self.assertPartFile(b"abcd")
+
+    def test_stale_offset(self):
+        """A chunk sent by a client that missed a previous one is refused,
+        even if the upload instance is out of date"""
+        stale = Upload.objects.get(id=self.upload.id)
+        self.upload.write_chunk(0, BytesIO(b"abcd"), 4)
+        self.assertIsNone(stale.write_chunk(0, BytesIO(b"wxyz"), 4))
+        self.assertPartFile(b"abcd")
+
+    def test_chunk_being_written(self):
+        """Concurrent chunks are refused instead of waiting for the lock"""
+        self.upload.path.touch()
+        with open(self.upload.path, "r+b") as f:
+            lock_file(f)
+            self.assertIsNone(self.upload.write_chunk(0, BytesIO(b"abcd"), 4))
+        self.assertEqual(self.upload.write_chunk(0, BytesIO(b"abcd"), 4), 4)
+        self.assertPartFile(b"abcd")
+
+    def test_short_chunk(self):
+        self.assertEqual(self.upload.write_chunk(0, BytesIO(b"abc"), 4), 3)
+        self.assertPartFile(b"abc")
+        self.assertEqual(self.upload.write_chunk(3, BytesIO(b"defg"), 4), 4)
+        self.assertPartFile(b"abcdefg")
+
+
+class GetRangeTest(SimpleTestCase):
+    """Single byte ranges are honoured, others send the whole file"""
+
+    etag = '"a-1"'
+    last_modified = 1700000000
+
+    def get_range(self, size=10, **headers):
+        request = RequestFactory().get("/", headers=headers)
+        return get_range(request, size, self.etag, self.last_modified)
+
+    def test_no_range(self):
+        self.assertIsNone(self.get_range())
+
+    def test_range(self):
+        self.assertEqual(self.get_range(range="bytes=2-5"), (2, 5))
+        self.assertEqual(self.get_range(range="bytes=4-"), (4, 9))
+
+    def test_suffix_range(self):
+        self.assertEqual(self.get_range(range="bytes=-3"), (7, 9))
+        # suffix longer than the file is the whole file
+        self.assertEqual(self.get_range(range="bytes=-30"), (0, 9))
+        with self.assertRaises(ValueError):
+            self.get_range(range="bytes=-0")
+
+    def test_range_past_eof(self):
+        # end is clamped to the last byte
+        self.assertEqual(self.get_range(range="bytes=5-100"), (5, 9))
+        with self.assertRaises(ValueError):
+            self.get_range(range="bytes=10-")
+        with self.assertRaises(ValueError):
+            self.get_range(range="bytes=12-20")
+        with self.assertRaises(ValueError):
+            self.get_range(range="bytes=5-2")
+
+    def test_ignored_ranges(self):
+        self.assertIsNone(self.get_range(range="bytes=0-1,4-5"))
+        self.assertIsNone(self.get_range(range="bytes=-"))
+        self.assertIsNone(self.get_range(range="items=0-1"))
+
+    def test_if_range(self):
+        self.assertEqual(self.get_range(range="bytes=2-5", if_range=self.etag), (2, 5))
+        date = http_date(self.last_modified)
+        self.assertEqual(self.get_range(range="bytes=2-5", if_range=date), (2, 5))
+        self.assertIsNone(self.get_range(range="bytes=2-5", if_range='"b-2"'))
+        date = http_date(self.last_modified + 60)
+        self.assertIsNone(self.get_range(range="bytes=2-5", if_range=date))
+
+
+class ServeFileTest(SimpleTestCase):
+    """Without a front-end server, Django streams ranges itself"""
+
+    def setUp(self):
+        f = tempfile.NamedTemporaryFile(suffix=".jpg", delete=False)
+        f.write(b"0123456789")
+        f.close()
+        self.path = f.name
+
+    def tearDown(self):
+        os.unlink(self.path)
+
+    def serve(self, **headers):
+        request = RequestFactory().get("/", headers=headers)
+        return serve_file(request, self.path, "image.jpg")
+
+    def test_partial_content(self):
+        response = self.serve(range="bytes=-4")
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response["Content-Range"], "bytes 6-9/10")
+        self.assertEqual(b"".join(response.streaming_content), b"6789")
+        response.close()
+
+    def test_not_satisfiable(self):
+        response = self.serve(range="bytes=10-")
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response["Content-Range"], "bytes */10")
+
+    @override_settings(FUNICULAR_UP_SENDFILE="lighttpd")
+    def test_unknown_backend(self):
+        with self.assertRaises(ImproperlyConfigured):
+            self.serve()
+
+
+class ConditionalTest(TestCase):
+    """Pages sharing validators have different etags"""
+
+    def setUp(self):
+        user = User.objects.create_user("user")
+        self.client.force_login(user)
+        self.folder = Folder.objects.create(name="folder", date="2020-01-01")
+        self.entry = Entry.objects.create(folder=self.folder, status="DW")
+
+    def test_folder_and_entry(self):
+        folder = self.client.get(
+            reverse("funicular_up:folder_detail", args=[self.folder.id])
+        )
+        entry = self.client.get(
+            reverse("funicular_up:entry_detail_available", args=[self.entry.id]),
+            headers={"if-none-match": folder["ETag"]},
+        )
+        self.assertEqual(entry.status_code, 200)
+        self.assertNotEqual(folder["ETag"], entry["ETag"])
+
+    def test_login(self):
+        """Pages are sent again with the token of the new session"""
+        url = reverse("funicular_up:folder_detail", args=[self.folder.id])
+        self.client.get(url)
+        response = self.client.get(url)
+        etag = response["ETag"]
+        response = self.client.get(url, headers={"if-none-match": etag})
+        self.assertEqual(response.status_code, 304)
+        self.client.logout()
+        self.client.force_login(User.objects.get(username="user"))
+        response = self.client.get(url, headers={"if-none-match": etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_query_params(self):
+        url = reverse("funicular_up:folder_list_date")
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        month = self.client.get(
+            url, {"month": "2020-01"}, headers={"if-none-match": response["ETag"]}
+        )
+        self.assertEqual(month.status_code, 200)
+        month = self.client.get(
+            url, {"month": "2020-01"}, headers={"if-none-match": month["ETag"]}
+        )
+        self.assertEqual(month.status_code, 304)
+
+
+class TransitionTest(TestCase):
+    """Entries move only from the statuses allowed by TRANSITIONS"""
+
+    def setUp(self):
+        self.folder = Folder.objects.create(name="folder")
+        past = timezone.now() - timedelta(days=1)
+        self.entries = {
+            status: Entry.objects.create(folder=self.folder, status=status)
+            for status in ("UP", "DW", "RQ", "ST", "KI")
+        }
+        Entry.objects.update(modified=past)
+        self.past = past
+
+    def test_transition(self):
+        with mock.patch("funicular_up.models.notify_entries") as notify:
+            moved = Entry.objects.all().transition("DW")
+        self.assertCountEqual(moved, [self.entries["UP"].id, self.entries["KI"].id])
+        notify.assert_called_once()
+        self.assertCountEqual(notify.call_args.args[0], moved)
+        self.assertCountEqual(
+            Transition.objects.values_list("entry_id", "source", "target"),
+            [(self.entries["UP"].id, "UP", "DW"), (self.entries["KI"].id, "KI", "DW")],
+        )
+        for entry in Entry.objects.filter(id__in=moved):
+            self.assertEqual(entry.status, "DW")
+            self.assertGreater(entry.modified, self.past)
+
+    def test_wrong_source(self):
+        """Entries in other statuses are left alone"""
+        entries = Entry.objects.exclude(status="DW")
+        self.assertEqual(entries.transition("RQ"), [])
+        self.assertFalse(Transition.objects.exists())
+        for status, entry in self.entries.items():
+            entry.refresh_from_db()
+            self.assertEqual(entry.status, status)
+            self.assertEqual(entry.modified, self.past)
+
+    def test_filtered(self):
+        """Only entries of the queryset move"""
+        other = Entry.objects.create(folder=self.folder, status="DW")
+        moved = Entry.objects.filter(id=other.id).transition("RQ")
+        self.assertEqual(moved, [other.id])
+        self.entries["DW"].refresh_from_db()
+        self.assertEqual(self.entries["DW"].status, "DW")
+
+    def test_empty(self):
+        self.assertEqual(Entry.objects.none().transition("DW"), [])
+        self.assertEqual(Entry.objects.filter(id__in=[]).transition("RQ"), [])
+        self.assertEqual(Entry.set_many_as_downloaded([]), ([], None))
+        self.assertFalse(Transition.objects.exists())
+
+    def test_detail_view(self):
+        """Viewing an entry logs a transition only if it is killed"""
+        self.client.force_login(User.objects.create_user("user"))
+        for status in ("UP", "ST"):
+            url = reverse(
+                "funicular_up:entry_detail_available", args=[self.entries[status].id]
+            )
+            self.assertEqual(self.client.get(url).status_code, 200)
+            self.assertEqual(self.client.get(url).status_code, 200)
+        self.assertEqual(
+            list(Transition.objects.values_list("entry_id", "source", "target")),
+            [(self.entries["ST"].id, "ST", "KI")],
+        )
+
+    def test_prune(self):
+        Entry.objects.filter(status="UP").transition("DW")
+        Entry.objects.filter(status="KI").transition("DW")
+        old = Transition.objects.filter(entry=self.entries["UP"])
+        old.update(created=timezone.now() - timedelta(days=91))
+        self.assertEqual(prune_transitions(), 1)
+        self.assertEqual(
+            list(Transition.objects.values_list("entry_id", flat=True)),
+            [self.entries["KI"].id],
+        )
+        with override_settings(FUNICULAR_UP_TRANSITION_KEEP=0):
+            self.assertEqual(prune_transitions(), 1)
+
+
+class PlaceEntriesTest(SimpleTestCase):
+    """Entries in order keep their positions"""
+
+    def entries(self, *positions):
+        return [SimpleNamespace(id=i, position=p) for i, p in enumerate(positions)]
+
+    def assertIncreasing(self, entries):
+        positions = [entry.position for entry in entries]
+        self.assertEqual(positions, sorted(set(positions)))
+
+    def test_increasing_subsequence(self):
+        self.assertEqual(increasing_subsequence([]), [])
+        self.assertEqual(increasing_subsequence([3, 1, 2]), [1, 2])
+        self.assertEqual(increasing_subsequence([1, 5, 2, 3, 4]), [0, 2, 3, 4])
+        # strictly increasing, None skipped
+        self.assertEqual(increasing_subsequence([2, 2, None, 3]), [1, 3])
+        self.assertEqual(increasing_subsequence([None, None]), [])
+
+    def test_in_order(self):
+        entries = self.entries(1024, 2048, 3072)
+        self.assertEqual(place_entries(entries), [])
+
+    def test_single_move(self):
+        entries = self.entries(1024, 2048, 3072, 4096)
+        entries.insert(1, entries.pop(3))
+        changed = place_entries(entries)
+        self.assertEqual([entry.id for entry in changed], [3])
+        self.assertIncreasing(entries)
+
+    def test_move_to_end(self):
+        entries = self.entries(1024, 2048, 3072)
+        entries.append(entries.pop(0))
+        changed = place_entries(entries)
+        self.assertEqual([entry.id for entry in changed], [0])
+        self.assertIncreasing(entries)
+
+    def test_new_entries(self):
+        """Entries without position are placed after the previous one"""
+        entries = self.entries(None, 1024, None, None)
+        changed = place_entries(entries)
+        self.assertEqual([entry.id for entry in changed], [0, 2, 3])
+        self.assertIncreasing(entries)
+        self.assertGreater(entries[0].position, 0)
+
+    def test_exhausted_gap(self):
+        """Positions are spread again when there is no room left"""
+        entries = self.entries(1, 2, 3)
+        entries.insert(1, entries.pop(2))
+        changed = place_entries(entries)
+        self.assertIncreasing(entries)
+        self.assertEqual([entry.position for entry in entries], [1024, 2048, 3072])
+        self.assertEqual(len(changed), 3)
+
+
+class SortEntriesTest(TestCase):
+    """Sorting costs the same few queries whatever the folder size"""
+
+    def setUp(self):
+        self.folder = Folder.objects.create(name="folder")
+        self.entries = self.folder.add_entries([None] * 30)
+
+    def get_order(self):
+        return list(self.folder.entry_set.values_list("id", flat=True))
+
+    def test_single_move(self):
+        ids = [str(entry.id) for entry in self.entries]
+        ids.insert(3, ids.pop(20))
+        # savepoint, select, update of entry, update of folder, release
+        with self.assertNumQueries(5):
+            changed = self.folder.sort_entries(ids)
+        self.assertEqual(len(changed), 1)
+        self.assertEqual(self.get_order(), [int(id) for id in ids])
+
+    def test_full_reorder(self):
+        ids = [str(entry.id) for entry in reversed(self.entries)]
+        with self.assertNumQueries(5):
+            changed = self.folder.sort_entries(ids)
+        self.assertEqual(len(changed), 29)
+        self.assertEqual(self.get_order(), [int(id) for id in ids])
+
+    def test_in_order(self):
+        ids = [str(entry.id) for entry in self.entries]
+        # savepoint, select, release
+        with self.assertNumQueries(3):
+            self.assertEqual(self.folder.sort_entries(ids), [])
+
+
+class EntryPageTest(TestCase):
+    """Folder entries are paged by (position, id) cursor"""
+
+    def setUp(self):
+        self.client.force_login(User.objects.create_user("user"))
+        self.folder = Folder.objects.create(name="folder")
+        # positions tie after concurrent sorting
+        self.entries = Entry.objects.bulk_create(
+            Entry(folder=self.folder, position=i // 2 * 1024)
+            for i in range(ENTRY_PAGE_SIZE + 2)
+        )
+
+    def get_entries(self, cursor):
+        return self.client.get(
+            reverse("funicular_up:folder_entries", args=[self.folder.id]),
+            {"cursor": cursor},
+            headers={"hx-request": "true"},
+        )
+
+    def test_pages(self):
+        ids, cursor = [], None
+        while True:
+            entries, cursor = entry_page(self.folder, cursor, size=3)
+            ids += [entry.id for entry in entries]
+            if not cursor:
+                break
+        self.assertEqual(ids, [entry.id for entry in self.entries])
+
+    def test_views(self):
+        response = self.client.get(
+            reverse("funicular_up:folder_detail", args=[self.folder.id])
+        )
+        self.assertEqual(len(response.context["entries"]), ENTRY_PAGE_SIZE)
+        cursor = response.context["next_cursor"]
+        last = self.entries[ENTRY_PAGE_SIZE - 1]
+        self.assertEqual(cursor, f"{last.position}_{last.id}")
+        response = self.get_entries(cursor)
+        self.assertEqual(response.context["entries"], self.entries[ENTRY_PAGE_SIZE:])
+        self.assertIsNone(response.context["next_cursor"])
+
+    def test_queries(self):
+        last = self.entries[-3]
+        with CaptureQueriesContext(connection) as queries:
+            self.get_entries(f"{last.position}_{last.id}")
+        # a full page takes as many queries as the last two entries
+        self.assertNumQueries(len(queries), self.get_entries, "0_0")
+
+    def test_invalid(self):
+        for cursor in ("abc", "1", "1_2_3", "1_x"):
+            self.assertEqual(self.get_entries(cursor).status_code, 404, cursor)
+        # full page requests are left to folder detail
+        response = self.client.get(
+            reverse("funicular_up:folder_entries", args=[self.folder.id])
+        )
+        self.assertEqual(response.status_code, 404)
+
+
+@mock.patch("funicular_up.views.DATE_PAGE_SIZE", 2)
+class FolderDateListTest(TestCase):
+    """Dated folders are paged by cursor, newest first, and by month"""
+
+    def setUp(self):
+        self.client.force_login(User.objects.create_user("user"))
+        self.folders = [
+            Folder.objects.create(name=name, date=date)
+            for name, date in (
+                ("a", "2024-03-10"),
+                ("b", "2024-03-10"),
+                ("c", "2024-02-01"),
+                ("d", "2023-12-31"),
+                ("e", "2023-05-05"),
+            )
+        ]
+        Folder.objects.create(name="undated")
+
+    def get(self, **params):
+        response = self.client.get(reverse("funicular_up:folder_list_date"), params)
+        self.assertEqual(response.status_code, 200)
+        return response.context
+
+    def test_pages(self):
+        context = self.get()
+        names = [folder.name for folder in context["object_list"]]
+        while "next_cursor" in context:
+            context = self.get(cursor=context["next_cursor"])
+            self.assertNotIn("years", context)
+            names += [folder.name for folder in context["object_list"]]
+        # same date, newest id first
+        self.assertEqual(names, ["b", "a", "c", "d", "e"])
+
+    def test_rows(self):
+        response = self.client.get(
+            reverse("funicular_up:folder_list_date"),
+            {"cursor": f"2024-03-10_{self.folders[1].id}"},
+            headers={"hx-request": "true"},
+        )
+        self.assertTemplateUsed(
+            response, "funicular_up/htmx/folder_list_date_rows.html"
+        )
+
+    def test_month(self):
+        context = self.get(month="2024-02")
+        self.assertEqual([f.name for f in context["object_list"]], ["c", "d"])
+        self.assertEqual(
+            [f.name for f in self.get(month="2023-06")["object_list"]], ["e"]
+        )
+
+    def test_years(self):
+        years = self.get()["years"]
+        self.assertEqual(list(years), [2024, 2023])
+        self.assertEqual(years[2024]["count"], 3)
+        self.assertEqual(
+            [(m["month"].month, m["count"]) for m in years[2024]["months"]],
+            [(3, 2), (2, 1)],
+        )
+
+    def test_invalid(self):
+        url = reverse("funicular_up:folder_list_date")
+        for params in (
+            {"cursor": "abc"},
+            {"cursor": "2024-03-10"},
+            {"cursor": "2024-13-10_1"},
+            {"cursor": "2024-03-10_x"},
+            {"month": "2024"},
+        ):
+            self.assertEqual(self.client.get(url, params).status_code, 404, params)
+
+
+class FolderMapDataTest(TestCase):
+    """Geolocated folders in the bounding box are clustered by zoom"""
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(User.objects.create_user("user"))
+        self.rome = [
+            Folder.objects.create(name=name, geom=point(*coords))
+            for name, coords in (
+                ("colosseum", (12.49, 41.89)),
+                ("vatican", (12.45, 41.9)),
+            )
+        ]
+        self.new_york = Folder.objects.create(name="new york", geom=point(-74, 40.7))
+        Folder.objects.create(name="nowhere")
+
+    def get_features(self, bbox="-180,-90,180,90", zoom=0, **headers):
+        response = self.client.get(
+            reverse("funicular_up:folder_map_data"),
+            {"bbox": bbox, "zoom": zoom},
+            headers=headers,
+        )
+        self.assertEqual(response.status_code, 200)
+        return response.json()["features"]
+
+    def test_clusters(self):
+        cluster, lone = self.get_features()
+        self.assertEqual(cluster["properties"], {"count": 2})
+        longitude, latitude = cluster["geometry"]["coordinates"]
+        self.assertAlmostEqual(longitude, 12.47)
+        self.assertAlmostEqual(latitude, 41.895)
+        self.assertEqual(lone["geometry"], self.new_york.geom)
+        self.assertEqual(lone["properties"]["count"], 1)
+        self.assertIn("new york", lone["properties"]["popupContent"]["content"])
+
+    def test_zoom(self):
+        features = self.get_features(zoom=12)
+        self.assertEqual(len(features), 3)
+        self.assertTrue(all(f["properties"]["count"] == 1 for f in features))
+
+    def test_bbox(self):
+        (feature,) = self.get_features(bbox="0,30,30,50")
+        self.assertEqual(feature["properties"]["count"], 2)
+        # clamped to the world
+        self.assertEqual(len(self.get_features(bbox="-500,-100,500,100")), 2)
+
+    def test_cached(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.get_features()
+        # cached features, queries are left to authentication
+        with CaptureQueriesContext(connection) as cached:
+            self.get_features()
+        self.assertLess(len(cached), len(queries))
+        Folder.objects.create(name="paris", geom=point(2.35, 48.85))
+        self.assertEqual(self.get_features()[0]["properties"]["count"], 3)
+
+    def test_etag(self):
+        response = self.client.get(
+            reverse("funicular_up:folder_map_data"), {"bbox": "0,30,30,50", "zoom": 3}
+        )
+        # small moves snap to the same grid
+        response = self.client.get(
+            reverse("funicular_up:folder_map_data"),
+            {"bbox": "0.1,30.1,29.9,49.9", "zoom": 3},
+            headers={"if-none-match": response["ETag"]},
+        )
+        self.assertEqual(response.status_code, 304)
+
+    def test_invalid(self):
+        url = reverse("funicular_up:folder_map_data")
+        for params in (
+            {"bbox": "nan,0,1,1", "zoom": 0},
+            {"bbox": "-inf,0,1,1", "zoom": 0},
+            {"bbox": "1,0,0,1", "zoom": 0},
+            {"bbox": "0,1,1,0", "zoom": 0},
+            {"bbox": "0,0,1", "zoom": 0},
+            {"bbox": "a,b,c,d", "zoom": 0},
+            {"bbox": "0,0,1,1", "zoom": MAP_MAX_ZOOM + 1},
+            {"bbox": "0,0,1,1"},
+        ):
+            self.assertEqual(self.client.get(url, params).status_code, 400, params)
+
+
+class FolderDeleteTest(TestCase):
+    """Entries deleted along with their folder send no signals of
+    their own"""
+
+    def setUp(self):
+        self.folder = Folder.objects.create(name="folder")
+        subfolder = Folder.objects.create(name="subfolder", parent=self.folder)
+        self.folder.add_entries([None] * 20)
+        subfolder.add_entries([None] * 20)
+
+    def test_delete_folder(self):
+        with mock.patch("funicular_up.models.clear_folder_tree_cache") as clear:
+            with CaptureQueriesContext(connection) as context:
+                self.folder.delete()
+        clear.assert_called_once()
+        self.assertFalse(Entry.objects.exists())
+        updates = [q["sql"] for q in context if q["sql"].startswith("UPDATE")]
+        self.assertEqual(updates, [])
+
+    def test_delete_entry(self):
+        Folder.objects.update(modified=timezone.now() - timedelta(days=1))
+        self.folder.entry_set.first().delete()
+        self.folder.refresh_from_db()
+        self.assertGreater(self.folder.modified, timezone.now() - timedelta(hours=1))
+
+
+@override_settings(FUNICULAR_UP_GEOCODER="funicular_up.geocoding.offline")
+@mock.patch("funicular_up.geocoding.GEOCODE_INTERVAL", 0)
+class GeocodeTest(TestCase):
+    """Provider is asked once per address, misses are retried after a while"""
+
+    def setUp(self):
+        patcher = mock.patch("funicular_up.geocoding.offline")
+        self.provider = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.provider.side_effect = lambda address: (
+            (12.5, 41.9) if "rome" in address.lower() else None
+        )
+
+    def test_cached(self):
+        self.assertIsNone(get_cached("Rome"))
+        found = geocode("Rome")
+        self.assertEqual(found.geom, {"type": "Point", "coordinates": [12.5, 41.9]})
+        # addresses are normalized
+        self.assertEqual(geocode("  ROME "), found)
+        self.assertEqual(get_cached("rome"), found)
+        self.provider.assert_called_once_with("Rome")
+
+    def test_miss(self):
+        missed = geocode("Atlantis")
+        self.assertIsNone(missed.geom)
+        self.assertEqual(get_cached("Atlantis"), missed)
+        geocode("Atlantis")
+        self.assertEqual(self.provider.call_count, 1)
+        # expired misses are looked up again and updated
+        GeocodedAddress.objects.update(
+            created=timezone.now() - GEOCODE_MISS_TTL - timedelta(seconds=1)
+        )
+        self.assertIsNone(get_cached("Atlantis"))
+        now = timezone.now()
+        geocode("Atlantis")
+        self.assertEqual(self.provider.call_count, 2)
+        self.assertGreaterEqual(GeocodedAddress.objects.get().created, now)
+
+    def test_found_kept(self):
+        geocode("Rome")
+        GeocodedAddress.objects.update(
+            created=timezone.now() - GEOCODE_MISS_TTL - timedelta(seconds=1)
+        )
+        self.assertIsNotNone(get_cached("Rome"))
+
+    def test_provider_error(self):
+        self.provider.side_effect = ConnectionError
+        with self.assertRaises(ConnectionError):
+            geocode("Rome")
+        self.assertFalse(GeocodedAddress.objects.exists())
+
+    def test_folder(self):
+        self.client.force_login(User.objects.create_superuser("user"))
+        geocode("Rome")
+        url = reverse("funicular_up:folder_create")
+        # cached address is set right away
+        self.client.post(url, {"name": "cached", "address": "rome"})
+        self.assertEqual(
+            Folder.objects.get(name="cached").geom["coordinates"], [12.5, 41.9]
+        )
+        self.assertFalse(Job.objects.exists())
+        # others are left to a job
+        self.client.post(url, {"name": "queued", "address": "Rome, Italy"})
+        folder = Folder.objects.get(name="queued")
+        self.assertIsNone(folder.geom)
+        job = Job.objects.get(task="geocode_folder")
+        self.assertEqual(job.payload, {"folder": folder.id, "address": "Rome, Italy"})
+        # the test transaction is not an old connection
+        with mock.patch("funicular_up.tasks.close_old_connections"):
+            run_job(claim_jobs(1)[0])
+        folder.refresh_from_db()
+        self.assertEqual(folder.geom["coordinates"], [12.5, 41.9])
+
+
+class StreamStatusTest(TestCase):
+    """Pending entries are streamed as NDJSON lines in id order"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user("user"))
+        folder = Folder.objects.create(name="folder")
+        self.entries = [
+            Entry.objects.create(folder=folder, status=status)
+            for status in ("UP", "DW", "RQ", "KI")
+        ]
+
+    def get_lines(self, **params):
+        response = self.client.get(reverse("funicular_up:stream_status"), params)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        return [json.loads(line) for line in response.getvalue().splitlines()]
+
+    def test_stream(self):
+        lines = self.get_lines()
+        self.assertEqual(
+            [(line["id"], line["status"]) for line in lines],
+            [(self.entries[i].id, self.entries[i].status) for i in (0, 2, 3)],
+        )
+
+    def test_after(self):
+        lines = self.get_lines(after=self.entries[0].id)
+        self.assertEqual(
+            [line["id"] for line in lines], [self.entries[2].id, self.entries[3].id]
+        )
+        self.assertEqual(self.get_lines(after=self.entries[3].id), [])
+
+    def test_queries(self):
+        # images are joined, not fetched entry by entry
+        with CaptureQueriesContext(connection) as queries:
+            self.get_lines()
+        Entry.objects.bulk_create(
+            Entry(folder=self.entries[0].folder, status="UP") for i in range(10)
+        )
+        self.assertNumQueries(len(queries), self.get_lines)
+
+    def test_invalid(self):
+        for after in ("abc", "-1"):
+            response = self.client.get(
+                reverse("funicular_up:stream_status"), {"after": after}
+            )
+            self.assertEqual(response.status_code, 400, after)
+
+
+class EntriesDownloadedTest(TestCase):
+    """Batch of entries is marked as downloaded with a single downscale job"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user("user"))
+        folder = Folder.objects.create(name="folder")
+        self.entries = [
+            Entry.objects.create(folder=folder, status=status)
+            for status in ("UP", "KI", "ST")
+        ]
+
+    def post(self, ids):
+        return self.client.post(
+            reverse("funicular_up:entries_download"), {"ids": ids}, format="json"
+        )
+
+    def test_batch(self):
+        up, ki, st = self.entries
+        response = self.post([up.id, ki.id, st.id, st.id + 1])
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(
+            data["results"],
+            {
+                str(up.id): "downloaded",
+                str(ki.id): "downloaded",
+                str(st.id): "not downloadable, status ST",
+                str(st.id + 1): "not found",
+            },
+        )
+        job = Job.objects.get()
+        self.assertEqual(data["job"], job.id)
+        self.assertEqual(job.task, "downscale_images")
+        self.assertEqual(sorted(job.payload["ids"]), [up.id, ki.id])
+        self.assertEqual(
+            list(Entry.objects.order_by("id").values_list("status", flat=True)),
+            ["DW", "DW", "ST"],
+        )
+
+    def test_nothing_downloaded(self):
+        response = self.post([self.entries[2].id])
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(response.json()["job"])
+        self.assertFalse(Job.objects.exists())
+
+    def test_invalid(self):
+        for ids in ([], ["abc"], list(range(BATCH_MAX_SIZE + 1))):
+            self.assertEqual(self.post(ids).status_code, 400)
+        self.assertFalse(Job.objects.exists())
+
+
+class AsyncStreamStatusTest(TestCase):
+    """Pending entries are streamed by an async iterator"""
+
+    def setUp(self):
+        token = Token.objects.create(user=User.objects.create_user("user"))
+        self.headers = {"authorization": f"Token {token.key}"}
+        folder = Folder.objects.create(name="folder")
+        self.entries = [
+            Entry.objects.create(folder=folder, status=status)
+            for status in ("UP", "DW", "RQ", "KI")
+        ]
+
+    async def get_lines(self, **params):
+        response = await self.async_client.get(
+            reverse("funicular_up:async_stream_status"), params, headers=self.headers
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.is_async)
+        return [json.loads(line) async for line in response.streaming_content]
+
+    async def test_stream(self):
+        lines = await self.get_lines()
+        self.assertEqual(
+            [(line["id"], line["status"]) for line in lines],
+            [(self.entries[i].id, self.entries[i].status) for i in (0, 2, 3)],
+        )
+
+    async def test_after(self):
+        lines = await self.get_lines(after=self.entries[2].id)
+        self.assertEqual([line["id"] for line in lines], [self.entries[3].id])
+
+    async def test_unauthenticated(self):
+        response = await self.async_client.get(
+            reverse("funicular_up:async_stream_status")
+        )
+        self.assertEqual(response.status_code, 401)
+
+
+class RequestAllTest(TestCase):
+    """Subfolders are requested only if asked for"""
+
+    def setUp(self):
+        self.client.force_login(User.objects.create_user("user"))
+        self.folder = Folder.objects.create(name="folder")
+        subfolder = Folder.objects.create(name="subfolder", parent=self.folder)
+        self.entry = Entry.objects.create(folder=self.folder, status="DW")
+        self.subentry = Entry.objects.create(folder=subfolder, status="DW")
+
+    def request_all(self, **params):
+        url = reverse("funicular_up:folder_request", args=[self.folder.id])
+        return self.client.get(url, params)
+
+    def get_statuses(self):
+        self.entry.refresh_from_db()
+        self.subentry.refresh_from_db()
+        return self.entry.status, self.subentry.status
+
+    def test_folder(self):
+        for value in ("false", "0"):
+            Entry.objects.update(status="DW")
+            self.assertEqual(self.request_all(subfolders=value).status_code, 200)
+            self.assertEqual(self.get_statuses(), ("RQ", "DW"))
+        Entry.objects.update(status="DW")
+        self.request_all()
+        self.assertEqual(self.get_statuses(), ("RQ", "DW"))
+
+    def test_subfolders(self):
+        for value in ("true", "1"):
+            Entry.objects.update(status="DW")
+            self.assertEqual(self.request_all(subfolders=value).status_code, 200)
+            self.assertEqual(self.get_statuses(), ("RQ", "RQ"))
+
+    def test_invalid(self):
+        self.assertEqual(self.request_all(subfolders="maybe").status_code, 404)
+        self.assertEqual(self.get_statuses(), ("DW", "DW"))
+
+
+class ChangesTest(TestCase):
+    """Cursors move only past settled changes, deletions are sent too"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user("user"))
+        self.folder = Folder.objects.create(name="folder")
+
+    def create_entry(self, age):
+        entry = Entry.objects.create(folder=self.folder)
+        entry.modified = timezone.now() - timedelta(seconds=age)
+        Entry.objects.filter(id=entry.id).update(modified=entry.modified)
+        return entry
+
+    def get_changes(self, **params):
+        response = self.client.get(reverse("funicular_up:send_changes"), params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_cursor(self):
+        settled = (timezone.now() - timedelta(days=1, microseconds=3), 12)
+        sent = (timezone.now(), 345)
+        self.assertEqual(decode_cursor(encode_cursor(settled, sent)), (settled, sent))
+        # cursors of older versions hold a single position
+        self.assertEqual(decode_cursor(encode_position(sent)), (sent, sent))
+
+    def test_invalid_cursor(self):
+        for cursor in ("abc", "1-2-3", "1-2-3-4-5-6", f"{10**20 - 1}-1"):
+            response = self.client.get(
+                reverse("funicular_up:send_changes"), {"cursor": cursor}
+            )
+            self.assertEqual(response.status_code, 400, cursor)
+
+    def test_settle(self):
+        old = self.create_entry(CHANGES_SETTLE.total_seconds() + 5)
+        new = self.create_entry(CHANGES_SETTLE.total_seconds() - 5)
+        data = self.get_changes()
+        self.assertEqual(list(data["entries"]), [str(old.id), str(new.id)])
+        settled, sent = decode_cursor(data["cursor"])
+        self.assertEqual(settled, (old.modified, old.id))
+        self.assertEqual(sent, (new.modified, new.id))
+        # unsettled entries are sent again
+        data = self.get_changes(cursor=data["cursor"])
+        self.assertEqual(list(data["entries"]), [str(new.id)])
+        self.assertEqual(decode_cursor(data["cursor"]), (settled, sent))
+
+    def test_more(self):
+        self.create_entry(CHANGES_SETTLE.total_seconds() + 10)
+        self.create_entry(CHANGES_SETTLE.total_seconds() + 5)
+        self.create_entry(CHANGES_SETTLE.total_seconds() - 5)
+        data = self.get_changes(limit=1)
+        self.assertTrue(data["more"])
+        data = self.get_changes(limit=1, cursor=data["cursor"])
+        self.assertTrue(data["more"])
+        # the next page would start from an unsettled entry
+        data = self.get_changes(limit=1, cursor=data["cursor"])
+        self.assertEqual(len(data["entries"]), 1)
+        self.assertFalse(data["more"])
+
+    def test_deleted(self):
+        kept = self.create_entry(60)
+        deleted = self.create_entry(60)
+        cursor = self.get_changes()["cursor"]
+        ids = [deleted.id, kept.id]
+        deleted.delete()
+        data = self.get_changes(cursor=cursor)
+        self.assertEqual(data["entries"], {})
+        self.assertEqual(data["deleted"], ids[:1])
+        self.folder.delete()
+        data = self.get_changes(cursor=cursor)
+        self.assertEqual(data["deleted"], ids)
+
+    async def test_wait(self):
+        """Long polls answer with the same data"""
+        user = await User.objects.aget(username="user")
+        token = await Token.objects.acreate(user=user)
+        entry = await sync_to_async(self.create_entry)(60)
+        id = entry.id
+        await entry.adelete()
+        response = await self.async_client.get(
+            reverse("funicular_up:wait_changes"),
+            {"timeout": 0},
+            headers={"authorization": f"Token {token.key}"},
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["deleted"], [id])
+
+
+def jpeg(color="red", size=(300, 200)):
+    content = BytesIO()
+    PILImage.new("RGB", size, color).save(content, "JPEG")
+    return content.getvalue()
+
+
+def point(longitude, latitude):
+    return {"type": "Point", "coordinates": [longitude, latitude]}
+
+
+def create_image(name="image.jpg", color="red", size=(300, 200)):
+    """Filer image of a plain color"""
+    return FilerImage.objects.create(
+        file=ContentFile(jpeg(color, size), name=name), original_filename=name
+    )
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class ThumbnailQueueTest(TestCase):
+    """Pages don't render missing thumbnails, workers do"""
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(User.objects.create_user("user"))
+        self.folder = Folder.objects.create(name="folder")
+        (self.entry,) = self.folder.add_entries([create_image()])
+        self.url = reverse("funicular_up:folder_detail", args=[self.folder.id])
+
+    def test_placeholder(self):
+        response = self.client.get(self.url)
+        self.assertContains(response, "Thumbnail in preparation")
+        self.assertNotContains(response, "filer_public_thumbnails")
+        job = Job.objects.get()
+        self.assertEqual(job.task, "thumbnail_entries")
+        self.assertEqual(job.payload["ids"], [self.entry.id])
+        # queued once
+        self.client.get(self.url)
+        self.assertEqual(Job.objects.count(), 1)
+
+    def test_thumbnail(self):
+        etag = self.client.get(self.url)["ETag"]
+        Folder.objects.update(modified=timezone.now() - timedelta(days=1))
+        make_thumbnails([self.entry.id])
+        response = self.client.get(self.url, headers={"if-none-match": etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotContains(response, "Thumbnail in preparation")
+        self.entry.refresh_from_db()
+        self.assertContains(response, self.entry.thumbnail)
+
+
+class JobTest(TestCase):
+    """Jobs are claimed once, lost jobs are run again a few times"""
+
+    def setUp(self):
+        self.jobs = [enqueue("thumbnail_entries", ids=[]) for i in range(3)]
+        # the test transaction is not an old connection
+        patcher = mock.patch("funicular_up.tasks.close_old_connections")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def age_heartbeat(self, job, **kwargs):
+        past = timezone.now() - JOB_TIMEOUT - timedelta(seconds=1)
+        Job.objects.filter(id=job.id).update(heartbeat=past, **kwargs)
+
+    def test_claim(self):
+        self.assertEqual(claim_jobs(2), [self.jobs[0].id, self.jobs[1].id])
+        self.assertEqual(claim_jobs(2), [self.jobs[2].id])
+        self.assertEqual(claim_jobs(2), [])
+        for job in Job.objects.all():
+            self.assertEqual((job.status, job.attempts), ("RU", 1))
+            self.assertIsNotNone(job.heartbeat)
+
+    def test_lost(self):
+        """Running jobs without heartbeat are claimed again"""
+        claim_jobs(2)
+        self.age_heartbeat(self.jobs[0])
+        beat_jobs([self.jobs[1].id])
+        self.assertEqual(claim_jobs(3), [self.jobs[0].id, self.jobs[2].id])
+        job = Job.objects.get(id=self.jobs[0].id)
+        self.assertEqual((job.status, job.attempts), ("RU", 2))
+        self.assertEqual(Job.objects.get(id=self.jobs[1].id).attempts, 1)
+
+    def test_max_attempts(self):
+        claim_jobs(1)
+        self.age_heartbeat(self.jobs[0], attempts=JOB_MAX_ATTEMPTS)
+        self.assertNotIn(self.jobs[0].id, claim_jobs(3))
+        job = Job.objects.get(id=self.jobs[0].id)
+        self.assertEqual((job.status, job.error), ("FA", "Worker lost"))
+
+    def test_release(self):
+        claim_jobs(2)
+        release_jobs(Job.objects.all(), "Worker died")
+        statuses = Job.objects.values_list("status", flat=True)
+        self.assertEqual(list(statuses), ["PE", "PE", "PE"])
+
+    def test_fail(self):
+        claim_jobs(1)
+        fail_job(self.jobs[0].id, "error")
+        fail_job(self.jobs[1].id, "error")
+        statuses = Job.objects.values_list("status", "error")
+        self.assertEqual(list(statuses), [("FA", "error"), ("PE", None), ("PE", None)])
+
+    def test_run(self):
+        (id,) = claim_jobs(1)
+        with mock.patch.dict(TASKS, thumbnail_entries=lambda job: None):
+            self.assertEqual(run_job(id).status, "DO")
+        with mock.patch.dict(TASKS, thumbnail_entries=lambda job: 1 / 0):
+            (id,) = claim_jobs(1)
+            self.assertEqual(run_job(id).status, "FA")
+        job = Job.objects.get(id=id)
+        self.assertEqual(job.status, "FA")
+        self.assertIn("ZeroDivisionError", job.error)
+
+    def test_run_released(self):
+        """A run whose job was claimed again leaves it to the new run"""
+
+        def claimed_again(job):
+            self.age_heartbeat(job)
+            self.assertEqual(claim_jobs(1), [job.id])
+
+        (id,) = claim_jobs(1)
+        with mock.patch.dict(TASKS, thumbnail_entries=claimed_again):
+            job = run_job(id)
+        self.assertEqual((job.status, job.attempts), ("RU", 2))
+
+    def test_prune(self):
+        Job.objects.filter(id=self.jobs[0].id).update(status="DO")
+        Job.objects.filter(id=self.jobs[1].id).update(status="FA")
+        past = timezone.now() - JOB_KEEP - timedelta(seconds=1)
+        Job.objects.update(modified=past)
+        self.assertEqual(prune_jobs(), 2)
+        self.assertEqual(list(Job.objects.all()), [self.jobs[2]])
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class NeighboursTest(TestCase):
+    """Entry detail links the nearest viewable entries of the folder"""
+
+    def setUp(self):
+        self.folder = Folder.objects.create(name="folder")
+        image = create_image()
+        statuses = ("UP", "DW", "ST", "RQ", "KI", "DW", "UP", "RQ")
+        self.entries = [
+            Entry.objects.create(
+                folder=self.folder, position=i // 2, status=status, image=image
+            )
+            for i, status in enumerate(statuses)
+        ]
+        # entries of other folders don't count
+        other = Folder.objects.create(name="other")
+        Entry.objects.create(folder=other, position=4, status="UP")
+
+    def test_neighbours(self):
+        with self.assertNumQueries(1):
+            previous, next = self.entries[4].get_neighbours()
+            # images come with the same query
+            self.assertEqual(previous.image.width, next.image.width)
+        self.assertEqual((previous, next), (self.entries[2], self.entries[6]))
+
+    def test_not_viewable(self):
+        # a downloaded entry still links its viewable neighbours
+        self.assertEqual(
+            self.entries[1].get_neighbours(), (self.entries[0], self.entries[2])
+        )
+
+    def test_ends(self):
+        self.assertEqual(self.entries[0].get_neighbours(), (None, self.entries[2]))
+        self.assertEqual(self.entries[6].get_neighbours(), (self.entries[4], None))
+        lone = Entry.objects.create(folder=Folder.objects.create(name="lone"))
+        self.assertEqual(lone.get_neighbours(), (None, None))
+
+
+@override_settings(
+    MEDIA_ROOT=tempfile.mkdtemp(), FILE_UPLOAD_TEMP_DIR=tempfile.mkdtemp()
+)
+class BlobTest(TestCase):
+    """Entries with the same content share an image"""
+
+    def setUp(self):
+        self.folder = Folder.objects.create(name="folder")
+        patcher = mock.patch("funicular_up.tasks.close_old_connections")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def ingest(self, *contents):
+        files = [
+            stage_file(SimpleUploadedFile(f"image{i}.jpg", content))
+            for i, content in enumerate(contents)
+        ]
+        enqueue("ingest_images", folder=self.folder.id, files=files)
+        # thumbnails of previous ingests too
+        while ids := claim_jobs(10):
+            for id in ids:
+                job = run_job(id)
+                self.assertEqual(job.status, "DO", job.error)
+        return list(self.folder.entry_set.select_related("image"))
+
+    def test_ingest(self):
+        red, blue = jpeg("red"), jpeg("blue")
+        entries = self.ingest(red, blue, red)
+        self.assertEqual(len(entries), 3)
+        self.assertEqual(entries[0].image, entries[2].image)
+        self.assertNotEqual(entries[0].image, entries[1].image)
+        self.assertEqual(Blob.objects.count(), 2)
+        self.assertEqual(FilerImage.objects.count(), 2)
+        # uploaded again later
+        entries = self.ingest(red)
+        self.assertEqual(entries[3].image, entries[0].image)
+        self.assertEqual(Blob.objects.count(), 2)
+
+    def test_hashed_once(self):
+        """Staging doesn't read files, filer hashes them in the job"""
+        generate_sha1 = FilerImage.generate_sha1
+        with mock.patch.object(
+            FilerImage, "generate_sha1", autospec=True, side_effect=generate_sha1
+        ) as hashed:
+            entries = self.ingest(jpeg("red"), jpeg("blue"))
+        self.assertEqual(hashed.call_count, 2)
+        job = Job.objects.get(task="ingest_images")
+        digests = [file[2] for file in job.payload["files"]]
+        self.assertEqual(digests, [entry.image.sha1 for entry in entries])
+
+    def test_resume(self):
+        """Files stored by an interrupted run, before their blob was added,
+        are found by digest"""
+        red, blue = jpeg("red"), jpeg("blue")
+        files = [
+            stage_file(SimpleUploadedFile(f"image{i}.jpg", content))
+            for i, content in enumerate((red, blue))
+        ]
+        stored = create_image()
+        os.unlink(files[0][0])
+        files[0] = (*files[0], stored.sha1)
+        enqueue("ingest_images", folder=self.folder.id, files=files)
+        (id,) = claim_jobs(1)
+        self.assertEqual(run_job(id).status, "DO")
+        entries = list(self.folder.entry_set.all())
+        self.assertEqual(len(entries), 2)
+        self.assertEqual(entries[0].image_id, stored.id)
+        self.assertEqual(Blob.objects.get(image=stored).digest, stored.sha1)
+
+    def test_delete_unused_image(self):
+        first, second = self.ingest(jpeg(), jpeg())
+        image = first.image
+        first.delete()
+        delete_unused_image(image)
+        self.assertTrue(Blob.objects.filter(image=image).exists())
+        second.delete()
+        delete_unused_image(image)
+        self.assertFalse(Blob.objects.exists())
+        self.assertFalse(FilerImage.objects.exists())
+
+    def test_restore_same_content(self):
+        red = jpeg("red")
+        first, second = self.ingest(red, red)
+        Entry.objects.filter(id=first.id).update(status="RQ")
+        first.refresh_from_db()
+        self.assertTrue(
+            first.restore_image(ContentFile(red, name="image.jpg"), "image.jpg")
+        )
+        self.assertEqual(first.image, second.image)
+        self.assertEqual(first.status, "ST")
+        self.assertEqual(FilerImage.objects.count(), 1)
+
+    def test_restore_digest(self):
+        client = APIClient()
+        client.force_authenticate(User.objects.create_user("user"))
+        entry, other = self.ingest(jpeg("red"), jpeg("blue"))
+        digest = other.image.blob.digest
+        Entry.objects.filter(id=entry.id).update(status="RQ")
+        url = reverse("funicular_up:restore_digest", args=[entry.id, digest])
+        response = client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["digest"], digest)
+        missing = reverse("funicular_up:restore_digest", args=[entry.id, "0" * 40])
+        self.assertEqual(client.get(missing).status_code, 404)
+        self.assertEqual(client.post(missing).status_code, 404)
+        old = entry.image
+        self.assertEqual(client.post(url).status_code, 200)
+        entry.refresh_from_db()
+        self.assertEqual((entry.status, entry.image), ("ST", other.image))
+        # the old image was used by the entry only
+        self.assertFalse(FilerImage.objects.filter(id=old.id).exists())
+        # entry is not requested anymore
+        self.assertEqual(client.post(url).status_code, 404)
+
+    def test_downscale(self):
+        first, second = self.ingest(jpeg(size=(600, 400)), jpeg(size=(600, 400)))
+        Entry.objects.update(status="DW")
+        first.refresh_from_db()
+        first.downscale_image()
+        image = FilerImage.objects.get(id=first.image.id)
+        self.assertEqual((image.width, image.height), (192, 128))
+        self.assertEqual(image.sha1, file_digest(image.file))
+        self.assertEqual(image.size, image.file.size)
+        self.assertFalse(Blob.objects.exists())
+
+    def test_downscale_shared(self):
+        """Images shown by other entries are kept"""
+        first, second = self.ingest(jpeg(size=(600, 400)), jpeg(size=(600, 400)))
+        Entry.objects.filter(id=first.id).update(status="DW")
+        first.refresh_from_db()
+        first.downscale_image()
+        image = FilerImage.objects.get(id=first.image.id)
+        self.assertEqual((image.width, image.height), (600, 400))
+        self.assertTrue(Blob.objects.filter(image=image).exists())
+
+
+class NotifyTest(SimpleTestCase):
+    """Notifications are sent on the database that commits"""
+
+    def test_using(self):
+        with mock.patch("funicular_up.broker.connections") as connections:
+            connections["other"].vendor = "postgresql"
+            notify_entries([1, 2], using="other")
+        connections.__getitem__.assert_called_with("other")
+        cursor = connections["other"].cursor.return_value.__enter__.return_value
+        cursor.execute.assert_called_once_with(
+            "SELECT pg_notify(%s, %s)", [CHANNEL, "1,2"]
+        )
+
+    def test_entries_db(self):
+        with mock.patch("funicular_up.broker.connections") as connections:
+            connections["default"].vendor = "postgresql"
+            notify_entries([1])
+        connections.__getitem__.assert_called_with("default")
+
+
+class SearchTest(TestCase):
+    """Stored search vectors are kept up to date and ranked by the view"""
+
+    def setUp(self):
+        self.client.force_login(User.objects.create_user("user"))
+        self.folder = Folder.objects.create(
+            name="Holidays in Rome", description="Pictures of the colosseum"
+        )
+        self.entries = [
+            Entry.objects.create(folder=self.folder, caption=caption)
+            for caption in ("Colosseum at night", "Colosseum, colosseum", "Pizza")
+        ]
+
+    def search(self, q):
+        response = self.client.get(reverse("funicular_up:search_results"), {"q": q})
+        self.assertEqual(response.status_code, 200)
+        return response.context
+
+    @skipUnless(connection.vendor == "postgresql", "Full text search needs PostgreSQL")
+    def test_results(self):
+        context = self.search("colosseum")
+        self.assertTrue(context["success"])
+        self.assertEqual(context["folders"], [self.folder])
+        # more occurrences rank first
+        self.assertEqual(context["images"], [self.entries[1], self.entries[0]])
+        self.assertFalse(self.search("gondola")["success"])
+
+    @skipUnless(connection.vendor == "postgresql", "Full text search needs PostgreSQL")
+    def test_updated(self):
+        self.entries[2].caption = "Pizza near the colosseum"
+        self.entries[2].save()
+        self.assertIn(self.entries[2], self.search("colosseum")["images"])
+        self.folder.description = "Pictures of the forum"
+        self.folder.save()
+        self.assertEqual(self.search("colosseum")["folders"], [])
+
+    @skipUnless(connection.vendor == "postgresql", "Full text search needs PostgreSQL")
+    def test_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.search("colosseum")
+        Entry.objects.bulk_create(
+            Entry(folder=Folder.objects.create(name=f"folder-{i}"), caption="Colosseum")
+            for i in range(5)
+        )
+        self.assertNumQueries(len(queries), self.search, "colosseum")
+
+    @skipUnless(connection.vendor == "postgresql", "Full text search needs PostgreSQL")
+    def test_index_command(self):
+        Folder.objects.update(search_vector=None)
+        Entry.objects.update(search_vector=None)
+        self.assertFalse(self.search("colosseum")["success"])
+        call_command("funicular_search_index", batch_size=2, stdout=StringIO())
+        context = self.search("colosseum")
+        self.assertEqual(context["folders"], [self.folder])
+        self.assertEqual(len(context["images"]), 2)
+
+    @skipUnless(connection.vendor != "postgresql", "Tests the fallback")
+    def test_index_command_unsupported(self):
+        with self.assertRaises(CommandError):
+            call_command("funicular_search_index", stdout=StringIO())
+
+    def test_invalid(self):
+        for params in ({}, {"q": ""}, {"q": "x" * 101}):
+            response = self.client.get(reverse("funicular_up:search_results"), params)
+            self.assertEqual(response.status_code, 200)
+            self.assertFalse(response.context["success"])
+
+
+class SearchBoxTest(TestCase):
+    """Typing asks for suggestions only, results are loaded on submit"""
+
+    def test_triggers(self):
+        self.client.force_login(User.objects.create_user("user"))
+        response = self.client.get(reverse("funicular_up:folder_list"))
+        self.assertContains(
+            response,
+            f'<form hx-get="{reverse("funicular_up:search_results")}"\n'
+            '      hx-trigger="submit"',
+        )
+        self.assertContains(
+            response,
+            f'hx-get="{reverse("funicular_up:search_typeahead")}"\n'
+            '         hx-trigger="input changed delay:200ms"',
+        )
+        self.assertNotContains(response, "keyup")
+
+
+class FolderTreeTest(TestCase):
+    """Folder tree is rendered by a single query, then cached"""
+
+    def setUp(self):
+        cache.clear()
+        self.root = Folder.objects.create(name="root")
+        self.child = Folder.objects.create(name="child", parent=self.root)
+        self.grandchild = Folder.objects.create(name="grandchild", parent=self.child)
+        self.sibling = Folder.objects.create(name="sibling")
+        self.child.add_entries([None, None])
+
+    def test_render(self):
+        with self.assertNumQueries(1):
+            tree = show_folder_tree()
+        self.assertHTMLEqual(
+            tree,
+            f"""<ul>
+            <li>{self.root.get_no_htmx_url()} (0)</li>
+            <ul>
+              <li>{self.child.get_no_htmx_url()} (2)</li>
+              <ul><li>{self.grandchild.get_no_htmx_url()} (0)</li></ul>
+            </ul>
+            <li>{self.sibling.get_no_htmx_url()} (0)</li>
+            </ul>""",
+        )
+
+    def test_cached(self):
+        show_folder_tree()
+        show_folder_tree(self.root)
+        with self.assertNumQueries(0):
+            show_folder_tree()
+            show_folder_tree(self.root)
+
+    def test_invalidated(self):
+        self.assertIn(f"{self.child.get_no_htmx_url()} (2)", show_folder_tree())
+        self.child.add_entries([None])
+        self.assertIn(f"{self.child.get_no_htmx_url()} (3)", show_folder_tree())
+        Folder.objects.create(name="new", parent=self.root)
+        self.assertIn(">new</a> (0)", show_folder_tree(self.root))
+        self.child.entry_set.first().delete()
+        self.assertIn(f"{self.child.get_no_htmx_url()} (2)", show_folder_tree())
+
+    def test_empty(self):
+        self.assertEqual(show_folder_tree(self.grandchild), "<p>No subfolders yet</p>")
@@ -1,7 +1,7 @@
 from django.contrib import admin
 from leaflet.admin import LeafletGeoAdmin
 
-from .models import Entry, Folder
+from .models import Blob, Entry, Folder, GeocodedAddress, Job, Transition
 
 
 class EntryAdmin(admin.TabularInline):
@@ -20,3 +20,45 @@ class FolderAdmin(LeafletGeoAdmin):
     inlines = [
         EntryAdmin,
     ]
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = (
+        "task",
+        "status",
+        "progress",
+        "modified",
+    )
+    list_filter = ("status",)
+
+
+@admin.register(GeocodedAddress)
+class GeocodedAddressAdmin(admin.ModelAdmin):
+    list_display = (
+        "address",
+        "longitude",
+        "latitude",
+    )
+    search_fields = ("address",)
+
+
+@admin.register(Transition)
+class TransitionAdmin(admin.ModelAdmin):
+    list_display = (
+        "entry",
+        "source",
+        "target",
+        "created",
+    )
+    list_filter = ("target",)
+
+
+@admin.register(Blob)
+class BlobAdmin(admin.ModelAdmin):
+    list_display = (
+        "digest",
+        "image",
+        "created",
+    )
+    search_fields = ("digest",)
@@ -1,5 +1,5 @@
 from django.apps import AppConfig
-from django.db.models.signals import post_migrate
+from django.db.models.signals import post_delete, post_migrate, post_save, pre_delete
 from django.utils.translation import gettext as _
 
 
@@ -21,4 +21,22 @@ class FunicularUpConfig(AppConfig):
     name = "funicular_up"
 
     def ready(self):
+        from .models import (
+            Entry,
+            Folder,
+            invalidate_folder_map,
+            invalidate_folder_tree,
+            record_deleted_entry,
+            record_deleted_folder_entries,
+            touch_folder,
+        )
+
         post_migrate.connect(create_funicular_up_group, sender=self)
+        for model in (Folder, Entry):
+            post_save.connect(invalidate_folder_tree, sender=model)
+            post_delete.connect(invalidate_folder_tree, sender=model)
+        post_save.connect(invalidate_folder_map, sender=Folder)
+        post_delete.connect(invalidate_folder_map, sender=Folder)
+        post_delete.connect(touch_folder, sender=Entry)
+        post_delete.connect(record_deleted_entry, sender=Entry)
+        pre_delete.connect(record_deleted_folder_entries, sender=Folder)
@@ -0,0 +1,162 @@
+"""Notifications of entry status transitions. Code changing statuses calls
+notify_entries: with PostgreSQL ids are sent by NOTIFY as the transaction
+commits, and the Broker of each event loop LISTENs on a connection of its
+own. Other databases fall back to an in-process broker, that covers single
+process deployments. Async views wait on the Broker of their event loop"""
+
+import asyncio
+import threading
+from weakref import WeakKeyDictionary
+
+from asgiref.sync import sync_to_async
+from django.apps import apps
+from django.db import connections, router, transaction
+
+CHANNEL = "funicular_up_entries"
+# NOTIFY payloads must be shorter than 8000 bytes
+PAYLOAD_SIZE = 7000
+# how often an idle listener checks if someone is still waiting
+LISTEN_CHECK = 5.0
+
+brokers = WeakKeyDictionary()
+brokers_lock = threading.Lock()
+
+
+def entries_db():
+    """Alias of the database entries are written to, brokers listen there"""
+    return router.db_for_write(apps.get_model("funicular_up", "Entry"))
+
+
+def notify_entries(ids, using=None):
+    """Notifies ids of entries whose status changed, once the transaction
+    on database using (where entries are written by default) commits"""
+    ids = [str(id) for id in ids]
+    if not ids:
+        return
+    using = using or entries_db()
+    connection = connections[using]
+    if connection.vendor == "postgresql":
+        payloads = [""]
+        for id in ids:
+            if len(payloads[-1]) + len(id) >= PAYLOAD_SIZE:
+                payloads.append("")
+            payloads[-1] += f",{id}" if payloads[-1] else id
+        with connection.cursor() as cursor:
+            for payload in payloads:
+                cursor.execute("SELECT pg_notify(%s, %s)", [CHANNEL, payload])
+    else:
+        transaction.on_commit(
+            lambda: publish_local([int(id) for id in ids]), using=using
+        )
+
+
+def publish_local(ids):
+    """In-process broker, hands ids to the brokers of all event loops"""
+    with brokers_lock:
+        targets = list(brokers.items())
+    for loop, broker in targets:
+        if not loop.is_closed():
+            loop.call_soon_threadsafe(broker.publish, ids)
+
+
+def listen():
+    """Opens a connection listening to notifications"""
+    connection = connections[entries_db()]
+    conn = connection.get_new_connection(connection.get_connection_params())
+    conn.autocommit = True
+    with conn.cursor() as cursor:
+        cursor.execute(f"LISTEN {CHANNEL}")
+    return conn
+
+
+def read_notifies(conn):
+    """Yields payloads received by conn, with psycopg2 or psycopg 3"""
+    if hasattr(conn, "poll"):
+        conn.poll()
+        while conn.notifies:
+            yield conn.notifies.pop(0).payload
+    else:
+        conn.pgconn.consume_input()
+        while (notify := conn.pgconn.notifies()) is not None:
+            yield notify.extra.decode()
+
+
+class Broker:
+    def __init__(self):
+        self.event = asyncio.Event()
+        self.queues = set()
+        self.waiters = 0
+        self.task = None
+
+    def subscribe(self):
+        """Returns the event set by next notification. Subscribe before
+        querying entries, so that changes in between are not missed"""
+        return self.event
+
+    def publish(self, ids):
+        """Wakes all waiters and hands ids to relaying queues"""
+        self.event.set()
+        self.event = asyncio.Event()
+        for queue in self.queues:
+            queue.put_nowait(ids)
+
+    def start(self):
+        if connections[entries_db()].vendor != "postgresql":
+            # notified by publish_local
+            return
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self.listen())
+
+    async def wait(self, event, timeout):
+        """Waits for event, returns False on timeout"""
+        self.waiters += 1
+        self.start()
+        try:
+            await asyncio.wait_for(event.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            self.waiters -= 1
+
+    def add_queue(self):
+        """Returns a queue receiving lists of notified ids"""
+        queue = asyncio.Queue()
+        self.queues.add(queue)
+        self.waiters += 1
+        self.start()
+        return queue
+
+    def remove_queue(self, queue):
+        self.queues.discard(queue)
+        self.waiters -= 1
+
+    async def listen(self):
+        """LISTENs while someone is waiting"""
+        conn = await sync_to_async(listen, thread_sensitive=False)()
+        loop = asyncio.get_running_loop()
+        readable = asyncio.Event()
+        loop.add_reader(conn.fileno(), readable.set)
+        try:
+            # changes committed before LISTEN started are looked for again
+            self.publish([])
+            while self.waiters:
+                try:
+                    await asyncio.wait_for(readable.wait(), LISTEN_CHECK)
+                except asyncio.TimeoutError:
+                    continue
+                readable.clear()
+                for payload in read_notifies(conn):
+                    self.publish([int(id) for id in payload.split(",")])
+        finally:
+            loop.remove_reader(conn.fileno())
+            conn.close()
+
+
+def get_broker():
+    """Broker of the running event loop"""
+    loop = asyncio.get_running_loop()
+    with brokers_lock:
+        if loop not in brokers:
+            brokers[loop] = Broker()
+        return brokers[loop]
@@ -0,0 +1,96 @@
+"""Address geocoding with a persistent cache. The provider is a callable
+taking an address and returning (longitude, latitude) or None, set with
+the FUNICULAR_UP_GEOCODER setting as a dotted path. Provider requests
+are serialized across processes: with PostgreSQL by an advisory lock,
+otherwise by the cache, that spans processes if the backend is shared"""
+
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from geopy.geocoders import Nominatim
+
+from .models import GeocodedAddress
+
+# seconds between provider requests, Nominatim usage policy allows one
+GEOCODE_INTERVAL = 1.0
+# addresses not found are looked up again after a while
+GEOCODE_MISS_TTL = timedelta(days=1)
+GEOCODE_LOCK = 0x66756E69
+GEOCODE_CACHE_KEY = "funicular_up_geocode_lock"
+
+
+def nominatim(address):
+    geolocator = Nominatim(user_agent="andywar65_funicular_up")
+    loc = geolocator.geocode(address)
+    if loc and loc.longitude and loc.latitude:
+        return loc.longitude, loc.latitude
+    return None
+
+
+def offline(address):
+    """Stand-in for tests and offline deployments, only addresses already
+    cached (or entered in admin) are found"""
+    return None
+
+
+def normalize(address):
+    return " ".join(address.lower().split())[:255]
+
+
+def get_cached(address):
+    """Cached result for address, misses expire after GEOCODE_MISS_TTL"""
+    return (
+        GeocodedAddress.objects.filter(address=normalize(address))
+        .exclude(longitude=None, created__lt=timezone.now() - GEOCODE_MISS_TTL)
+        .first()
+    )
+
+
+@contextmanager
+def provider_slot():
+    """Lets one process at a time ask the provider, and the next one only
+    GEOCODE_INTERVAL later"""
+    if connection.vendor == "postgresql":
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute("SELECT pg_advisory_xact_lock(%s)", [GEOCODE_LOCK])
+            try:
+                yield
+            finally:
+                time.sleep(GEOCODE_INTERVAL)
+    else:
+        while not cache.add(GEOCODE_CACHE_KEY, True, GEOCODE_INTERVAL):
+            time.sleep(GEOCODE_INTERVAL / 10)
+        yield
+
+
+def geocode(address):
+    """Returns cached result for address, asking the provider on a miss.
+    Provider errors propagate and nothing is cached"""
+    cached = get_cached(address)
+    if cached:
+        return cached
+    provider = import_string(
+        getattr(settings, "FUNICULAR_UP_GEOCODER", "funicular_up.geocoding.nominatim")
+    )
+    with provider_slot():
+        # found meanwhile by another process
+        cached = get_cached(address)
+        if cached:
+            return cached
+        coords = provider(address)
+    longitude, latitude = coords if coords else (None, None)
+    cached, created = GeocodedAddress.objects.update_or_create(
+        address=normalize(address),
+        defaults={
+            "longitude": longitude,
+            "latitude": latitude,
+            "created": timezone.now(),
+        },
+    )
+    return cached
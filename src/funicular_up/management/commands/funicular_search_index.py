@@ -0,0 +1,47 @@
+from django.contrib.postgres.search import SearchVector
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from funicular_up.models import Entry, Folder
+
+
+class Command(BaseCommand):
+    help = "Fills stored search vectors of folders and entries"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=5000,
+            help="Rows updated by each query",
+        )
+        parser.add_argument(
+            "--all",
+            action="store_true",
+            help="Rebuild vectors that are already filled too",
+        )
+
+    def handle(self, *args, **options):
+        if connection.vendor != "postgresql":
+            raise CommandError("Full text search needs PostgreSQL")
+        targets = (
+            (Folder, SearchVector("name", "description")),
+            (Entry, SearchVector("caption")),
+        )
+        for model, vector in targets:
+            queryset = model.objects.order_by("id")
+            if not options["all"]:
+                queryset = queryset.filter(search_vector=None)
+            total = 0
+            last = 0
+            while True:
+                ids = list(
+                    queryset.filter(id__gt=last).values_list("id", flat=True)[
+                        : options["batch_size"]
+                    ]
+                )
+                if not ids:
+                    break
+                total += model.objects.filter(id__in=ids).update(search_vector=vector)
+                last = ids[-1]
+            self.stdout.write(f"{model._meta.verbose_name_plural}: {total} updated")
@@ -0,0 +1,48 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.core.management.base import BaseCommand
+
+from funicular_up.models import Entry
+from funicular_up.tasks import make_thumbnails
+
+
+class Command(BaseCommand):
+    help = "Generates thumbnails of entries in a pool of worker processes"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--processes",
+            type=int,
+            default=multiprocessing.cpu_count(),
+            help="Number of worker processes",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=50,
+            help="Entries handled by each process at a time",
+        )
+        parser.add_argument(
+            "--all",
+            action="store_true",
+            help="Regenerate thumbnails that are already stored too",
+        )
+
+    def handle(self, *args, **options):
+        queryset = Entry.objects.exclude(image=None).order_by("id")
+        if not options["all"]:
+            queryset = queryset.filter(thumbnail="")
+        ids = list(queryset.values_list("id", flat=True))
+        size = options["batch_size"]
+        batches = [ids[i : i + size] for i in range(0, len(ids), size)]
+        with ProcessPoolExecutor(
+            max_workers=options["processes"],
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=django.setup,
+        ) as pool:
+            total = 0
+            for done in pool.map(make_thumbnails, batches):
+                total += done
+                self.stdout.write(f"{total}/{len(ids)} thumbnails generated")
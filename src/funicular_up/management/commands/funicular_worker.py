@@ -0,0 +1,96 @@
+import multiprocessing
+import time
+import traceback
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+import django
+from django.core.management.base import BaseCommand
+
+from funicular_up.models import Job
+from funicular_up.tasks import (
+    beat_jobs,
+    claim_jobs,
+    expire_uploads,
+    fail_job,
+    prune_jobs,
+    prune_transitions,
+    release_jobs,
+    run_job,
+)
+
+# seconds between deletions of old finished jobs, old transitions and
+# abandoned uploads
+PRUNE_INTERVAL = 60 * 60
+
+
+class Command(BaseCommand):
+    help = "Runs pending funicular_up jobs in a pool of worker processes"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--processes",
+            type=int,
+            default=multiprocessing.cpu_count(),
+            help="Number of worker processes",
+        )
+        parser.add_argument(
+            "--sleep",
+            type=float,
+            default=2.0,
+            help="Seconds to wait before polling again an empty queue",
+        )
+        parser.add_argument(
+            "--burst",
+            action="store_true",
+            help="Exit as soon as the queue is empty",
+        )
+
+    def handle(self, *args, **options):
+        # a worker process killed breaks the pool, a new one is started
+        while self.run_pool(options):
+            self.stderr.write("Worker process died, starting a new pool")
+
+    def run_pool(self, options):
+        """Runs jobs, returns True if the pool broke"""
+        processes = options["processes"]
+        # spawned processes set up Django on their own and open their own
+        # database connections, instead of sharing the parent's one
+        with ProcessPoolExecutor(
+            max_workers=processes,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=django.setup,
+        ) as pool:
+            running = {}
+            pruned = None
+            while True:
+                if pruned is None or time.monotonic() - pruned > PRUNE_INTERVAL:
+                    prune_jobs()
+                    prune_transitions()
+                    expire_uploads()
+                    pruned = time.monotonic()
+                if len(running) < processes:
+                    for id in claim_jobs(processes - len(running)):
+                        running[pool.submit(run_job, id)] = id
+                if not running:
+                    if options["burst"]:
+                        return False
+                    time.sleep(options["sleep"])
+                    continue
+                beat_jobs(running.values())
+                done, _ = wait(
+                    running, timeout=options["sleep"], return_when=FIRST_COMPLETED
+                )
+                for future in done:
+                    id = running.pop(future)
+                    try:
+                        job = future.result()
+                    except BrokenProcessPool:
+                        ids = [id, *running.values()]
+                        release_jobs(Job.objects.filter(id__in=ids), "Worker died")
+                        return True
+                    except Exception:
+                        fail_job(id, traceback.format_exc())
+                        self.stderr.write(f"Job {id}: worker error")
+                    else:
+                        self.stdout.write(f"{job}: {job.get_status_display()}")
@@ -0,0 +1,32 @@
+# Generated by Django 5.1.15 on 2026-10-18 13:07
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("funicular_up", "0004_alter_entry_options_entry_position_and_more"),
+        migrations.swappable_dependency(settings.FILER_IMAGE_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name="folder",
+            options={
+                "ordering": ("parent_id", "date", "name"),
+                "verbose_name": "Folder",
+                "verbose_name_plural": "Folders",
+            },
+        ),
+        migrations.AddField(
+            model_name="entry",
+            name="modified",
+            field=models.DateTimeField(auto_now=True, verbose_name="Modified"),
+        ),
+        migrations.AddIndex(
+            model_name="entry",
+            index=models.Index(fields=["modified", "id"], name="entry_modified_idx"),
+        ),
+    ]
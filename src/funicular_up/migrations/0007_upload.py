@@ -0,0 +1,56 @@
+# Generated by Django 5.1.15 on 2026-10-18 13:10
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("funicular_up", "0006_job"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="Upload",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("name", models.CharField(max_length=255, verbose_name="File name")),
+                ("size", models.PositiveBigIntegerField(verbose_name="Size")),
+                (
+                    "checksum",
+                    models.CharField(max_length=64, verbose_name="SHA-256 checksum"),
+                ),
+                (
+                    "offset",
+                    models.PositiveBigIntegerField(
+                        default=0, verbose_name="Bytes received"
+                    ),
+                ),
+                (
+                    "created",
+                    models.DateTimeField(auto_now_add=True, verbose_name="Created"),
+                ),
+                (
+                    "entry",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="funicular_up.entry",
+                        verbose_name="Entry",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Upload",
+                "verbose_name_plural": "Uploads",
+            },
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 5.1.15 on 2026-10-18 13:13
+
+from django.db import migrations, models
+
+POSITION_STEP = 1024
+
+
+def spread_positions(apps, schema_editor):
+    Entry = apps.get_model("funicular_up", "Entry")
+    folder_id = None
+    changed = []
+    for entry in Entry.objects.order_by("folder_id", "position", "id"):
+        if entry.folder_id != folder_id:
+            folder_id = entry.folder_id
+            i = 0
+        i += 1
+        entry.position = i * POSITION_STEP
+        changed.append(entry)
+    Entry.objects.bulk_update(changed, ["position"], batch_size=1000)
+
+
+def pack_positions(apps, schema_editor):
+    Entry = apps.get_model("funicular_up", "Entry")
+    folder_id = None
+    changed = []
+    for entry in Entry.objects.order_by("folder_id", "position", "id"):
+        if entry.folder_id != folder_id:
+            folder_id = entry.folder_id
+            i = 0
+        i += 1
+        entry.position = i
+        changed.append(entry)
+    Entry.objects.bulk_update(changed, ["position"], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("funicular_up", "0007_upload"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="entry",
+            name="position",
+            field=models.PositiveIntegerField(null=True, verbose_name="Position"),
+        ),
+        migrations.RunPython(spread_positions, pack_positions),
+    ]
@@ -0,0 +1,79 @@
+# Generated by Django 5.1.15 on 2026-10-18 13:14
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+# search vectors are built the same way SearchVector() builds them on the fly,
+# with the default text search configuration used by SearchQuery()
+CREATE_SQL = """
+CREATE FUNCTION funicular_up_folder_search_vector() RETURNS trigger AS $$
+BEGIN
+    NEW.search_vector := to_tsvector(
+        COALESCE(NEW.name, '') || ' ' || COALESCE(NEW.description, '')
+    );
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+CREATE TRIGGER funicular_up_folder_search_vector
+    BEFORE INSERT OR UPDATE OF name, description ON funicular_up_folder
+    FOR EACH ROW EXECUTE FUNCTION funicular_up_folder_search_vector();
+CREATE INDEX funicular_up_folder_search_idx
+    ON funicular_up_folder USING gin (search_vector);
+
+CREATE FUNCTION funicular_up_entry_search_vector() RETURNS trigger AS $$
+BEGIN
+    NEW.search_vector := to_tsvector(COALESCE(NEW.caption, ''));
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+CREATE TRIGGER funicular_up_entry_search_vector
+    BEFORE INSERT OR UPDATE OF caption ON funicular_up_entry
+    FOR EACH ROW EXECUTE FUNCTION funicular_up_entry_search_vector();
+CREATE INDEX funicular_up_entry_search_idx
+    ON funicular_up_entry USING gin (search_vector);
+"""
+
+DROP_SQL = """
+DROP INDEX IF EXISTS funicular_up_entry_search_idx;
+DROP TRIGGER IF EXISTS funicular_up_entry_search_vector ON funicular_up_entry;
+DROP FUNCTION IF EXISTS funicular_up_entry_search_vector();
+DROP INDEX IF EXISTS funicular_up_folder_search_idx;
+DROP TRIGGER IF EXISTS funicular_up_folder_search_vector ON funicular_up_folder;
+DROP FUNCTION IF EXISTS funicular_up_folder_search_vector();
+"""
+
+
+def create_triggers(apps, schema_editor):
+    # full text search is available on PostgreSQL only
+    if schema_editor.connection.vendor == "postgresql":
+        schema_editor.execute(CREATE_SQL)
+
+
+def drop_triggers(apps, schema_editor):
+    if schema_editor.connection.vendor == "postgresql":
+        schema_editor.execute(DROP_SQL)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("funicular_up", "0008_sparse_entry_position"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="entry",
+            name="search_vector",
+            field=django.contrib.postgres.search.SearchVectorField(
+                editable=False, null=True
+            ),
+        ),
+        migrations.AddField(
+            model_name="folder",
+            name="search_vector",
+            field=django.contrib.postgres.search.SearchVectorField(
+                editable=False, null=True
+            ),
+        ),
+        migrations.RunPython(create_triggers, drop_triggers),
+    ]
@@ -0,0 +1,37 @@
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+
+CREATE_SQL = """
+CREATE INDEX funicular_up_folder_name_trgm_idx
+    ON funicular_up_folder USING gin (name gin_trgm_ops);
+CREATE INDEX funicular_up_entry_caption_trgm_idx
+    ON funicular_up_entry USING gin (caption gin_trgm_ops);
+"""
+
+DROP_SQL = """
+DROP INDEX IF EXISTS funicular_up_entry_caption_trgm_idx;
+DROP INDEX IF EXISTS funicular_up_folder_name_trgm_idx;
+"""
+
+
+def create_indexes(apps, schema_editor):
+    # trigram indexes are available on PostgreSQL only
+    if schema_editor.connection.vendor == "postgresql":
+        schema_editor.execute(CREATE_SQL)
+
+
+def drop_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor == "postgresql":
+        schema_editor.execute(DROP_SQL)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("funicular_up", "0009_search_vector"),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.RunPython(create_indexes, drop_indexes),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 5.1.15 on 2026-10-18 13:18
+
+from django.db import migrations, models
+
+
+def copy_location(apps, schema_editor):
+    Folder = apps.get_model("funicular_up", "Folder")
+    changed = []
+    for folder in Folder.objects.exclude(geom=None).only("id", "geom"):
+        coords = folder.geom.get("coordinates") if folder.geom else None
+        if coords:
+            folder.longitude, folder.latitude = coords[:2]
+            changed.append(folder)
+    Folder.objects.bulk_update(changed, ["longitude", "latitude"], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("funicular_up", "0011_geocodedaddress"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="folder",
+            name="latitude",
+            field=models.FloatField(editable=False, null=True, verbose_name="Latitude"),
+        ),
+        migrations.AddField(
+            model_name="folder",
+            name="longitude",
+            field=models.FloatField(
+                editable=False, null=True, verbose_name="Longitude"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="folder",
+            index=models.Index(
+                condition=models.Q(("longitude__isnull", False)),
+                fields=["longitude", "latitude"],
+                name="folder_location_idx",
+            ),
+        ),
+        migrations.RunPython(copy_location, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.1.15 on 2026-10-18 13:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("funicular_up", "0012_folder_location"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="folder",
+            index=models.Index(
+                condition=models.Q(("date__isnull", False)),
+                fields=["-date", "-id"],
+                name="folder_date_idx",
+            ),
+        ),
+    ]
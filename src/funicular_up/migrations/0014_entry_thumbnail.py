@@ -0,0 +1,20 @@
+# Generated by Django 5.1.15 on 2026-10-18 13:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("funicular_up", "0013_folder_date_index"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="entry",
+            name="thumbnail",
+            field=models.CharField(
+                blank=True, editable=False, max_length=255, verbose_name="Thumbnail"
+            ),
+        ),
+    ]
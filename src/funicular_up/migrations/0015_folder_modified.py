@@ -0,0 +1,24 @@
+# Generated by Django 5.1.15 on 2026-10-18 14:02
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("funicular_up", "0014_entry_thumbnail"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="folder",
+            name="modified",
+            field=models.DateTimeField(
+                auto_now=True,
+                default=django.utils.timezone.now,
+                verbose_name="Modified",
+            ),
+            preserve_default=False,
+        ),
+    ]
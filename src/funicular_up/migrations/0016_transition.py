@@ -0,0 +1,74 @@
+# Generated by Django 5.1.15 on 2026-10-18 13:32
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("funicular_up", "0015_folder_modified"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="Transition",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "source",
+                    models.CharField(
+                        choices=[
+                            ("UP", "Uploaded to server"),
+                            ("DW", "Downloaded to local"),
+                            ("RQ", "Requested on server"),
+                            ("ST", "Restored from local"),
+                            ("KI", "Kill on server"),
+                        ],
+                        max_length=2,
+                        verbose_name="From",
+                    ),
+                ),
+                (
+                    "target",
+                    models.CharField(
+                        choices=[
+                            ("UP", "Uploaded to server"),
+                            ("DW", "Downloaded to local"),
+                            ("RQ", "Requested on server"),
+                            ("ST", "Restored from local"),
+                            ("KI", "Kill on server"),
+                        ],
+                        max_length=2,
+                        verbose_name="To",
+                    ),
+                ),
+                (
+                    "created",
+                    models.DateTimeField(auto_now_add=True, verbose_name="Created"),
+                ),
+                (
+                    "entry",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="transitions",
+                        to="funicular_up.entry",
+                        verbose_name="Entry",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Transition",
+                "verbose_name_plural": "Transitions",
+                "ordering": ["-created", "-id"],
+            },
+        ),
+    ]
@@ -0,0 +1,65 @@
+# Generated by Django 5.1.15 on 2026-10-18 13:36
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("funicular_up", "0016_transition"),
+        migrations.swappable_dependency(settings.FILER_IMAGE_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="entry",
+            name="folder",
+            field=models.ForeignKey(
+                db_index=False,
+                on_delete=django.db.models.deletion.CASCADE,
+                to="funicular_up.folder",
+                verbose_name="Folder",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="folder",
+            name="parent",
+            field=models.ForeignKey(
+                blank=True,
+                db_index=False,
+                null=True,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="children",
+                to="funicular_up.folder",
+                verbose_name="parent",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="entry",
+            index=models.Index(
+                condition=models.Q(("status__in", ["UP", "RQ", "KI"])),
+                fields=["id"],
+                name="entry_pending_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="entry",
+            index=models.Index(
+                fields=["folder", "status", "position"], name="entry_folder_status_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="entry",
+            index=models.Index(
+                fields=["folder", "position", "id"], name="entry_folder_position_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="folder",
+            index=models.Index(
+                fields=["parent", "date", "name"], name="folder_order_idx"
+            ),
+        ),
+    ]
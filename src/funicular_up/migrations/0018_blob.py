@@ -0,0 +1,74 @@
+# Generated by Django 5.1.15 on 2026-10-18 13:40
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+# statuses of entries whose original is on the server
+VIEWABLE = ["UP", "ST", "KI"]
+
+
+def add_blobs(apps, schema_editor):
+    """Originals already stored become blobs, digests computed by filer"""
+    Entry = apps.get_model("funicular_up", "Entry")
+    Blob = apps.get_model("funicular_up", "Blob")
+    images = (
+        Entry.objects.filter(status__in=VIEWABLE)
+        .exclude(image=None)
+        .exclude(image__sha1="")
+        .order_by("image_id")
+        .values_list("image__sha1", "image_id")
+    )
+    blobs = {}
+    for digest, image_id in images:
+        blobs.setdefault(digest, Blob(digest=digest, image_id=image_id))
+    Blob.objects.bulk_create(blobs.values(), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("funicular_up", "0017_status_indexes"),
+        migrations.swappable_dependency(settings.FILER_IMAGE_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="Blob",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "digest",
+                    models.CharField(
+                        max_length=40, unique=True, verbose_name="SHA-1 digest"
+                    ),
+                ),
+                (
+                    "created",
+                    models.DateTimeField(auto_now_add=True, verbose_name="Created"),
+                ),
+                (
+                    "image",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="blob",
+                        to=settings.FILER_IMAGE_MODEL,
+                        verbose_name="Image",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Blob",
+                "verbose_name_plural": "Blobs",
+            },
+        ),
+        migrations.RunPython(add_blobs, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.1.15 on 2026-10-18 13:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("funicular_up", "0018_blob"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="job",
+            name="attempts",
+            field=models.PositiveSmallIntegerField(
+                default=0, editable=False, verbose_name="Attempts"
+            ),
+        ),
+        migrations.AddField(
+            model_name="job",
+            name="heartbeat",
+            field=models.DateTimeField(
+                editable=False, null=True, verbose_name="Heartbeat"
+            ),
+        ),
+    ]
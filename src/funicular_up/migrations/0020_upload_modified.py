@@ -0,0 +1,18 @@
+# Generated by Django 5.1.15 on 2026-10-18 14:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("funicular_up", "0019_job_heartbeat"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="upload",
+            name="modified",
+            field=models.DateTimeField(auto_now=True, verbose_name="Modified"),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.1.15 on 2026-10-18 14:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("funicular_up", "0020_upload_modified"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="transition",
+            index=models.Index(fields=["created"], name="transition_created_idx"),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.1.15 on 2026-10-18 14:23
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("funicular_up", "0021_transition_created"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="DeletedEntry",
+            fields=[
+                (
+                    "id",
+                    models.BigIntegerField(
+                        primary_key=True, serialize=False, verbose_name="Entry id"
+                    ),
+                ),
+                (
+                    "modified",
+                    models.DateTimeField(
+                        default=django.utils.timezone.now, verbose_name="Deleted"
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Deleted entry",
+                "verbose_name_plural": "Deleted entries",
+                "indexes": [
+                    models.Index(fields=["modified", "id"], name="deleted_modified_idx")
+                ],
+            },
+        ),
+    ]
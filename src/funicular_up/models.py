@@ -1,44 +1,267 @@
+import hashlib
+import tempfile
+from bisect import bisect_left
+from pathlib import Path
+from uuid import uuid4
+
 import nh3
-from django.db import models
-from django.db.models import Q
+from django.conf import settings
+from django.contrib.postgres.search import SearchVectorField
+from django.core.cache import cache
+from django.core.exceptions import EmptyResultSet, ValidationError
+from django.core.files import File
+from django.db import connections, models, router, transaction
+from django.db.models import Count, F, Max, Q, Window
+from django.db.models.functions import Lag, Lead
 from django.urls import reverse
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 from djgeojson.fields import PointField
+from easy_thumbnails.files import get_thumbnailer
 from filer.fields.image import FilerImageField
+from filer.models import Image as FilerImage
 from PIL import Image
+from tree_queries.fields import TreeNodeForeignKey
 from tree_queries.models import TreeNode
 
+from .broker import notify_entries
 
-def show_folder_tree(queryset):
-    if not queryset.exists():
-        return _("<p>No subfolders yet</p>")
-    tree = "<ul>"
-    first = True
-    depth = queryset.first().tree_depth
-    first_depth = depth
+TREE_CACHE_VERSION = "funicular_up_tree_version"
+TREE_CACHE_TIMEOUT = 60 * 60 * 24
+MAP_CACHE_VERSION = "funicular_up_map_version"
+UPLOAD_BLOCK_SIZE = 1024 * 1024
+# entry positions are spaced, so that moves and insertions touch one row
+POSITION_STEP = 1024
+# thumbnail shown for each entry in folder pages
+THUMBNAIL_OPTIONS = {"size": (128, 128), "crop": True}
+
+
+def render_folder_tree(queryset):
+    """Renders a depth-first folder queryset annotated with entry_count
+    as nested unordered lists, in a single pass"""
+    tree = []
+    depth = first_depth = None
     for fld in queryset:
-        if first:
-            tree += f"<li>{fld.get_no_htmx_url()} ({fld.entry_set.count()})</li>"
-            first = False
+        if depth is None:
+            depth = first_depth = fld.tree_depth
+            tree.append("<ul>")
+        elif fld.tree_depth > depth:
+            tree.append("<ul>")
+            depth = fld.tree_depth
+        elif fld.tree_depth < depth:
+            tree.append("</ul>" * (depth - fld.tree_depth))
+            depth = fld.tree_depth
+        tree.append(f"<li>{fld.get_no_htmx_url()} ({fld.entry_count})</li>")
+    if depth is None:
+        return ""
+    tree.append("</ul>" * (depth + 1 - first_depth))
+    return "".join(tree)
+
+
+def show_folder_tree(folder=None):
+    """Returns the folder tree (or the subtree below folder), with entry
+    counts fetched in the same query. Markup is cached until a Folder
+    or Entry is added, changed or deleted"""
+    version = get_folder_tree_version()
+    key = f"funicular_up_tree_{version}_{folder.id if folder else 'all'}"
+    tree = cache.get(key)
+    if tree is None:
+        if folder:
+            queryset = folder.descendants()
         else:
-            if fld.tree_depth == depth:
-                tree += f"<li>{fld.get_no_htmx_url()} ({fld.entry_set.count()})</li>"
-            elif fld.tree_depth > depth:
-                tree += (
-                    f"<ul><li>{fld.get_no_htmx_url()} ({fld.entry_set.count()})</li>"
-                )
-                depth = fld.tree_depth
-            else:
-                for d in range(depth - fld.tree_depth):
-                    tree += "</ul>"
-                tree += f"<li>{fld.get_no_htmx_url()} ({fld.entry_set.count()})</li>"
-                depth = fld.tree_depth
-    for d in range(depth + 1 - first_depth):
-        tree += "</ul>"
+            queryset = Folder.objects.with_tree_fields()
+        tree = render_folder_tree(queryset.annotate(entry_count=Count("entry")))
+        cache.set(key, tree, TREE_CACHE_TIMEOUT)
+    if not tree:
+        return _("<p>No subfolders yet</p>")
     return tree
 
 
+def get_folder_tree_version():
+    return cache.get_or_set(TREE_CACHE_VERSION, lambda: uuid4().hex, None)
+
+
+def clear_folder_tree_cache():
+    cache.set(TREE_CACHE_VERSION, uuid4().hex, None)
+
+
+def get_folder_map_version():
+    return cache.get_or_set(MAP_CACHE_VERSION, lambda: uuid4().hex, None)
+
+
+def deleted_with_folder(instance, origin):
+    """Tells if instance is deleted by the cascade of a folder deletion,
+    whose own post_delete signal covers it"""
+    if isinstance(origin, models.QuerySet):
+        return origin.model is Folder and not isinstance(instance, Folder)
+    return isinstance(origin, Folder) and origin != instance
+
+
+def invalidate_folder_map(sender, instance, origin=None, **kwargs):
+    """Signal receiver, discards all cached map clusters"""
+    if deleted_with_folder(instance, origin):
+        return
+    cache.set(MAP_CACHE_VERSION, uuid4().hex, None)
+
+
+def invalidate_folder_tree(sender, instance, origin=None, **kwargs):
+    """Signal receiver, discards all cached folder trees"""
+    if sender is Entry and not kwargs.get("created", True):
+        # only additions and deletions change entry counts
+        return
+    if deleted_with_folder(instance, origin):
+        return
+    clear_folder_tree_cache()
+
+
+def touch_folder(sender, instance, origin=None, **kwargs):
+    """Signal receiver, entry deletions change folder pages"""
+    if deleted_with_folder(instance, origin):
+        return
+    Folder.objects.filter(id=instance.folder_id).update(modified=timezone.now())
+
+
+def record_deleted_entry(sender, instance, using, origin=None, **kwargs):
+    """Signal receiver, keeps the id of a deleted entry for sync clients
+    following changes. Entries deleted with a folder are recorded at once
+    by record_deleted_folder_entries"""
+    if deleted_with_folder(instance, origin):
+        return
+    DeletedEntry.objects.using(using).bulk_create(
+        [DeletedEntry(id=instance.id)], ignore_conflicts=True
+    )
+    notify_entries([instance.id], using)
+
+
+def record_deleted_folder_entries(sender, instance, using, **kwargs):
+    """Signal receiver, keeps ids of the entries of a folder being deleted"""
+    ids = list(
+        Entry.objects.using(using)
+        .filter(folder_id=instance.id)
+        .values_list("id", flat=True)
+    )
+    DeletedEntry.objects.using(using).bulk_create(
+        [DeletedEntry(id=id) for id in ids], ignore_conflicts=True
+    )
+    notify_entries(ids, using)
+
+
+def increasing_subsequence(values):
+    """Returns indices of a longest strictly increasing subsequence
+    of values, None values are skipped"""
+    tails, tail_values = [], []
+    previous = [None] * len(values)
+    for i, value in enumerate(values):
+        if value is None:
+            continue
+        k = bisect_left(tail_values, value)
+        if k > 0:
+            previous[i] = tails[k - 1]
+        if k == len(tails):
+            tails.append(i)
+            tail_values.append(value)
+        else:
+            tails[k] = i
+            tail_values[k] = value
+    indices = []
+    i = tails[-1] if tails else None
+    while i is not None:
+        indices.append(i)
+        i = previous[i]
+    return indices[::-1]
+
+
+def rebalance_positions(entries):
+    """Spreads positions of ordered entries evenly, returns changed ones"""
+    changed = []
+    for i, entry in enumerate(entries, start=1):
+        if entry.position != i * POSITION_STEP:
+            entry.position = i * POSITION_STEP
+            changed.append(entry)
+    return changed
+
+
+def place_entries(entries):
+    """Gives entries increasing positions in list order. Entries already in
+    order keep their position, the others are squeezed in the gaps, so a
+    single move changes a single entry. Returns changed entries"""
+    keep = set(increasing_subsequence([entry.position for entry in entries]))
+    changed = []
+    lower = 0
+    i = 0
+    while i < len(entries):
+        if i in keep:
+            lower = entries[i].position
+            i += 1
+            continue
+        j = i
+        while j < len(entries) and j not in keep:
+            j += 1
+        if j < len(entries):
+            upper = entries[j].position
+        else:
+            upper = lower + POSITION_STEP * (j - i + 1)
+        step = (upper - lower) // (j - i + 1)
+        if step < 1:
+            # gap is exhausted
+            return rebalance_positions(entries)
+        for k, entry in enumerate(entries[i:j], start=1):
+            entry.position = lower + step * k
+            changed.append(entry)
+        i = j
+    return changed
+
+
+def file_digest(f):
+    """SHA-1 hex digest of a django File, the same filer stores"""
+    sha = hashlib.sha1()
+    for chunk in f.chunks(UPLOAD_BLOCK_SIZE):
+        sha.update(chunk)
+    return sha.hexdigest()
+
+
+def delete_unused_image(image):
+    """Deletes image if no entry uses it. Its blob row is locked, as
+    entries are linked to blobs only while holding it"""
+    with transaction.atomic():
+        list(Blob.objects.select_for_update().filter(image=image))
+        if not image.entry_image.exists():
+            image.delete()
+
+
+def lock_file(f, blocking=True):
+    """Locks open file f until it is closed, returns False if blocking is
+    False and somebody else holds the lock. fcntl is imported here, so
+    that models load on systems without it, where uploads can't be sent
+    in chunks"""
+    import fcntl
+
+    try:
+        fcntl.flock(f, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+    except BlockingIOError:
+        return False
+    return True
+
+
+def get_temp_dir():
+    """Where uploads wait before being moved to storage"""
+    temp_dir = settings.FILE_UPLOAD_TEMP_DIR or tempfile.gettempdir()
+    path = Path(temp_dir) / "funicular_up"
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
 class Folder(TreeNode):
+    parent = TreeNodeForeignKey(
+        "self",
+        blank=True,
+        null=True,
+        on_delete=models.CASCADE,
+        verbose_name=_("parent"),
+        related_name="children",
+        # composite indexes starting with parent cover it
+        db_index=False,
+    )
     name = models.CharField(
         _("Name"),
         max_length=50,
@@ -48,6 +271,14 @@ class Folder(TreeNode):
         _("Date"), null=True, blank=True, help_text=_("YYYY-mm-dd format")
     )
     geom = PointField(_("Location"), null=True, blank=True)
+    # copied from geom on save, for bounding box queries
+    longitude = models.FloatField(_("Longitude"), null=True, editable=False)
+    latitude = models.FloatField(_("Latitude"), null=True, editable=False)
+    # also touched when entries are sorted, deleted or get thumbnails, see
+    # touch_folder and make_thumbnails
+    modified = models.DateTimeField(_("Modified"), auto_now=True)
+    # kept up to date by a database trigger, see migration 0009
+    search_vector = SearchVectorField(null=True, editable=False)
 
     class Meta:
         verbose_name = _("Folder")
@@ -74,10 +305,35 @@ class Folder(TreeNode):
                 violation_error_message=_("Root folder name must be unique"),
             ),
         ]
+        indexes = [
+            # default ordering of subfolders
+            models.Index(fields=["parent", "date", "name"], name="folder_order_idx"),
+            models.Index(
+                fields=["-date", "-id"],
+                condition=Q(date__isnull=False),
+                name="folder_date_idx",
+            ),
+            models.Index(
+                fields=["longitude", "latitude"],
+                condition=Q(longitude__isnull=False),
+                name="folder_location_idx",
+            ),
+        ]
 
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        coords = self.geom.get("coordinates") if self.geom else None
+        self.longitude, self.latitude = coords[:2] if coords else (None, None)
+        update_fields = kwargs.get("update_fields")
+        if update_fields:
+            update_fields = {*update_fields, "modified"}
+            if "geom" in update_fields:
+                update_fields |= {"longitude", "latitude"}
+            kwargs["update_fields"] = update_fields
+        super().save(*args, **kwargs)
+
     def get_absolute_url(self):
         return reverse("funicular_up:folder_detail", kwargs={"pk": self.id})
 
@@ -92,6 +348,53 @@ class Folder(TreeNode):
         url += f"{nh3.clean(self.name)}</a>"
         return url
 
+    def add_entries(self, images):
+        """Appends an entry for each image with a single insert"""
+        using = router.db_for_write(Entry)
+        with transaction.atomic(using=using):
+            # lock folder, so that concurrent additions get distinct positions
+            Folder.objects.using(using).select_for_update().get(id=self.id)
+            last = Entry.objects.using(using).filter(folder_id=self.id)
+            last = last.aggregate(Max("position"))["position__max"] or 0
+            entries = Entry.objects.using(using).bulk_create(
+                Entry(folder=self, image=image, position=last + POSITION_STEP * i)
+                for i, image in enumerate(images, start=1)
+            )
+            notify_entries([entry.id for entry in entries], using)
+        clear_folder_tree_cache()
+        return entries
+
+    def request_all(self, subfolders=False):
+        """Marks downloaded entries of folder (and of its subfolders) as
+        requested with a single update, returns number of entries"""
+        if subfolders:
+            # subquery, the tree is not loaded in python
+            folders = self.descendants(include_self=True).values("id")
+            entries = Entry.objects.filter(folder_id__in=folders)
+        else:
+            entries = Entry.objects.filter(folder_id=self.id)
+        return len(entries.transition("RQ"))
+
+    def sort_entries(self, id_list):
+        """Puts entries in the order of id_list (ids as strings), ids of
+        other folders are ignored. Entries missing from id_list follow in
+        their current order, so a partially loaded page can be sorted.
+        Returns changed entries"""
+        with transaction.atomic():
+            # folder_id is loaded too, deferring it costs a query per entry
+            entries = Entry.objects.filter(folder_id=self.id).select_for_update()
+            entries = {
+                str(entry.id): entry
+                for entry in entries.only("id", "position", "folder_id")
+            }
+            order = [entries.pop(id) for id in dict.fromkeys(id_list) if id in entries]
+            order += entries.values()
+            changed = place_entries(order)
+            Entry.objects.bulk_update(changed, ["position"])
+            if changed:
+                Folder.objects.filter(id=self.id).update(modified=timezone.now())
+        return changed
+
     @property
     def popupContent(self):
         title_str = (
@@ -102,6 +405,28 @@ class Folder(TreeNode):
         return {"content": title_str}
 
 
+class GeocodedAddress(models.Model):
+    """Geocoding results, addresses are looked up only once"""
+
+    address = models.CharField(_("Address"), max_length=255, unique=True)
+    longitude = models.FloatField(_("Longitude"), null=True, blank=True)
+    latitude = models.FloatField(_("Latitude"), null=True, blank=True)
+    created = models.DateTimeField(_("Created"), auto_now_add=True)
+
+    class Meta:
+        verbose_name = _("Geocoded address")
+        verbose_name_plural = _("Geocoded addresses")
+
+    def __str__(self):
+        return self.address
+
+    @property
+    def geom(self):
+        if self.longitude is None or self.latitude is None:
+            return None
+        return {"type": "Point", "coordinates": [self.longitude, self.latitude]}
+
+
 STATUS = [
     ("UP", _("Uploaded to server")),
     ("DW", _("Downloaded to local")),
@@ -109,13 +434,72 @@ STATUS = [
     ("ST", _("Restored from local")),
     ("KI", _("Kill on server")),
 ]
+# statuses of entries whose image is on the server
+VIEWABLE = ["UP", "ST", "KI"]
+# statuses of entries the sync client has to act upon
+PENDING = ["UP", "RQ", "KI"]
+# statuses each status can be reached from
+TRANSITIONS = {
+    "DW": ["UP", "KI"],
+    "RQ": ["DW"],
+    "ST": ["RQ"],
+    "KI": ["ST"],
+}
+
+
+class EntryQuerySet(models.QuerySet):
+    def transition(self, target):
+        """Moves entries to target status from the statuses allowed by
+        TRANSITIONS, with conditional updates, so entries changed meanwhile
+        by someone else are left alone. Transitions are logged and notified,
+        returns ids of entries moved"""
+        moved = []
+        now = timezone.now()
+        with transaction.atomic(using=self.db):
+            for source in TRANSITIONS[target]:
+                ids = self._update_status(source, target, now)
+                Transition.objects.using(self.db).bulk_create(
+                    Transition(entry_id=id, source=source, target=target) for id in ids
+                )
+                moved += ids
+            notify_entries(moved, self.db)
+        return moved
+
+    def _update_status(self, source, target, now):
+        """UPDATE ... WHERE status = source RETURNING id, where supported"""
+        connection = connections[self.db]
+        queryset = self.filter(status=source).order_by()
+        if not connection.features.can_return_columns_from_insert:
+            ids = list(queryset.select_for_update().values_list("id", flat=True))
+            Entry.objects.filter(id__in=ids).update(status=target, modified=now)
+            return ids
+        try:
+            sql, params = queryset.values("id").query.get_compiler(self.db).as_sql()
+        except EmptyResultSet:
+            # as update() does, nothing is run on empty querysets
+            return []
+        quote = connection.ops.quote_name
+        modified = Entry._meta.get_field("modified")
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"UPDATE {quote(Entry._meta.db_table)} "
+                f"SET {quote('status')} = %s, {quote(modified.column)} = %s "
+                f"WHERE {quote('status')} = %s AND {quote('id')} IN ({sql}) "
+                f"RETURNING {quote('id')}",
+                [target, modified.get_db_prep_save(now, connection), source, *params],
+            )
+            return [row[0] for row in cursor.fetchall()]
 
 
 class Entry(models.Model):
     folder = models.ForeignKey(
-        Folder, on_delete=models.CASCADE, verbose_name=_("Folder")
+        Folder,
+        on_delete=models.CASCADE,
+        verbose_name=_("Folder"),
+        # composite indexes starting with folder cover it
+        db_index=False,
     )
-    position = models.PositiveSmallIntegerField(_("Position"), null=True)
+    position = models.PositiveIntegerField(_("Position"), null=True)
     image = FilerImageField(
         verbose_name=_("Image"),
         related_name="entry_image",
@@ -130,40 +514,398 @@ class Entry(models.Model):
         default="UP",
         # editable=False,
     )
+    modified = models.DateTimeField(_("Modified"), auto_now=True)
+    objects = EntryQuerySet.as_manager()
+
+    # url of the thumbnail, generated by a worker
+    thumbnail = models.CharField(
+        _("Thumbnail"), max_length=255, blank=True, editable=False
+    )
+    # kept up to date by a database trigger, see migration 0009
+    search_vector = SearchVectorField(null=True, editable=False)
 
     class Meta:
         verbose_name = _("Entry")
         verbose_name_plural = _("Entries")
         ordering = ["position", "id"]
+        indexes = [
+            models.Index(fields=["modified", "id"], name="entry_modified_idx"),
+            # entries waiting for the sync client are a few among many
+            models.Index(
+                fields=["id"],
+                condition=Q(status__in=PENDING),
+                name="entry_pending_idx",
+            ),
+            # requests, neighbours and pages of entries of a folder
+            models.Index(
+                fields=["folder", "status", "position"],
+                name="entry_folder_status_idx",
+            ),
+            models.Index(
+                fields=["folder", "position", "id"], name="entry_folder_position_idx"
+            ),
+        ]
 
     def set_as_downloaded(self):
-        self.status = "DW"
-        with Image.open(self.image.path) as im:
-            if self.image.width >= self.image.height:
-                im.thumbnail((int(self.image.width / self.image.height * 128), 128))
+        """Marks entry as downloaded, original is downscaled by a worker.
+        Returns the downscale job, None if status changed meanwhile"""
+        return Entry.set_many_as_downloaded([self.id])[1]
+
+    @classmethod
+    def set_many_as_downloaded(cls, ids):
+        """Marks uploaded / killed entries among ids as downloaded with a
+        single update, returns updated ids and the downscale job"""
+        from .tasks import enqueue
+
+        updated = cls.objects.filter(id__in=ids).transition("DW")
+        job = enqueue("downscale_images", ids=updated) if updated else None
+        return updated, job
+
+    def downscale_image(self):
+        """Replaces original with a small preview, unless other entries
+        sharing the image still show it. The blob row is locked meanwhile,
+        so that nobody links the image while it is rewritten"""
+        if not self.image:
+            return
+        with transaction.atomic():
+            blob = Blob.objects.select_for_update().filter(image=self.image).first()
+            if self.image.entry_image.filter(status__in=VIEWABLE).exists():
+                return
+            if blob:
+                blob.delete()
+            with Image.open(self.image.path) as im:
+                if self.image.width >= self.image.height:
+                    im.thumbnail((int(self.image.width / self.image.height * 128), 128))
+                else:
+                    im.thumbnail((128, int(self.image.height / self.image.width * 128)))
+                im.save(self.image.path)
+                width, height = im.size
+            # filer digest, size and dimensions of the preview
+            with open(self.image.path, "rb") as f:
+                preview = File(f)
+                FilerImage.objects.filter(id=self.image.id).update(
+                    sha1=file_digest(preview),
+                    _file_size=preview.size,
+                    _width=width,
+                    _height=height,
+                )
+
+    def restore_image(self, content, name):
+        """Stores restored original, unless a blob with the same content
+        exists, then links entry to it. Returns False if entry was
+        restored meanwhile by someone else"""
+        # filer computes the digest, the image is saved only if needed
+        image = FilerImage(file=content, original_filename=name)
+        digest = image.sha1
+        stored = Blob.get_images([digest]).get(digest)
+        if stored is not None:
+            try:
+                return self.link_image(stored)
+            except Blob.DoesNotExist:
+                # downscaled meanwhile, content is stored again
+                pass
+        image = Blob.add(image, digest)
+        linked = self.link_image(image)
+        if not linked:
+            delete_unused_image(image)
+        return linked
+
+    def link_image(self, image):
+        """Points requested entry to the image of a blob and marks it as
+        restored, in a transaction holding the blob row, so that the image
+        is not downscaled meanwhile. Raises Blob.DoesNotExist if it was.
+        Old image is deleted only after the new one is in place, if no
+        other entry uses it, a worker generates the thumbnail. Returns
+        False if entry was restored meanwhile by someone else"""
+        from .tasks import enqueue
+
+        with transaction.atomic():
+            Blob.objects.select_for_update().get(image=image)
+            old = Entry.objects.values_list("image_id", flat=True).get(id=self.id)
+            # the image changes only along with the status
+            if not Entry.objects.filter(id=self.id, status="RQ").update(
+                image=image, thumbnail=""
+            ):
+                return False
+            Entry.objects.filter(id=self.id).transition("ST")
+        self.image = image
+        self.thumbnail = ""
+        self.status = "ST"
+        if old and old != image.id:
+            delete_unused_image(FilerImage.objects.get(id=old))
+        enqueue("thumbnail_entries", ids=[self.id])
+        return True
+
+    def make_thumbnail(self):
+        """Generates the thumbnail and stores its url, without touching
+        modified, as entry status does not change"""
+        if not self.image:
+            return
+        thumbnail = get_thumbnailer(self.image).get_thumbnail(THUMBNAIL_OPTIONS)
+        self.thumbnail = thumbnail.url
+        Entry.objects.filter(id=self.id).update(thumbnail=self.thumbnail)
+
+    def get_neighbours(self):
+        """Returns nearest viewable entries before and after this one
+        (or None), skipping downloaded and requested ones. A single
+        query: LAG / LEAD over viewable entries of the folder pick the
+        rows next to this one, images included"""
+        order = [F("position").asc(), F("id").asc()]
+        rows = (
+            Entry.objects.filter(
+                Q(status__in=VIEWABLE) | Q(id=self.id), folder_id=self.folder_id
+            )
+            .select_related("image")
+            .annotate(
+                previous_id=Window(Lag("id"), order_by=order),
+                next_id=Window(Lead("id"), order_by=order),
+            )
+            .filter(Q(previous_id=self.id) | Q(next_id=self.id))
+        )
+        previous = next = None
+        for row in rows:
+            if row.next_id == self.id:
+                previous = row
             else:
-                im.thumbnail((128, int(self.image.height / self.image.width * 128)))
-            im.save(self.image.path)
-        self.save()
+                next = row
+        return previous, next
 
-    def get_previous(self):
-        try:
-            prev = Entry.objects.get(
-                folder=self.folder,
-                position=(self.position - 1),
-                status__in=["UP", "ST", "KI"],
+
+class Blob(models.Model):
+    """Image holding an original, addressed by the SHA-1 digest of its
+    content: entries with the same content share the image, stored once.
+    Downscaled images are no blobs anymore"""
+
+    digest = models.CharField(_("SHA-1 digest"), max_length=40, unique=True)
+    image = models.OneToOneField(
+        settings.FILER_IMAGE_MODEL,
+        on_delete=models.CASCADE,
+        related_name="blob",
+        verbose_name=_("Image"),
+    )
+    created = models.DateTimeField(_("Created"), auto_now_add=True)
+
+    class Meta:
+        verbose_name = _("Blob")
+        verbose_name_plural = _("Blobs")
+
+    def __str__(self):
+        return self.digest
+
+    @classmethod
+    def get_images(cls, digests, lock=False):
+        """Maps digests of stored blobs to their images. Within a
+        transaction, lock holds the blob rows until entries are linked"""
+        blobs = cls.objects.filter(digest__in=digests).select_related("image")
+        if lock:
+            blobs = blobs.select_for_update(of=("self",))
+        return {blob.digest: blob.image for blob in blobs}
+
+    @classmethod
+    def add(cls, image, digest):
+        """Saves a new image as blob, returns the image holding its
+        content: if a concurrent upload stored the same content first,
+        the new image is dropped"""
+        image.save()
+        blob, created = cls.objects.get_or_create(
+            digest=digest, defaults={"image": image}
+        )
+        if not created:
+            image.delete()
+        return blob.image
+
+
+class DeletedEntry(models.Model):
+    """Id of a deleted entry and time of deletion, so that sync clients
+    following changes learn about it, see SendChanges"""
+
+    id = models.BigIntegerField(_("Entry id"), primary_key=True)
+    modified = models.DateTimeField(_("Deleted"), default=timezone.now)
+
+    class Meta:
+        verbose_name = _("Deleted entry")
+        verbose_name_plural = _("Deleted entries")
+        indexes = [
+            models.Index(fields=["modified", "id"], name="deleted_modified_idx"),
+        ]
+
+    def __str__(self):
+        return str(self.id)
+
+
+JOB_STATUS = [
+    ("PE", _("Pending")),
+    ("RU", _("Running")),
+    ("DO", _("Done")),
+    ("FA", _("Failed")),
+]
+
+
+class Transition(models.Model):
+    """Log of entry status transitions"""
+
+    entry = models.ForeignKey(
+        Entry,
+        on_delete=models.CASCADE,
+        related_name="transitions",
+        verbose_name=_("Entry"),
+    )
+    source = models.CharField(_("From"), max_length=2, choices=STATUS)
+    target = models.CharField(_("To"), max_length=2, choices=STATUS)
+    created = models.DateTimeField(_("Created"), auto_now_add=True)
+
+    class Meta:
+        verbose_name = _("Transition")
+        verbose_name_plural = _("Transitions")
+        ordering = ["-created", "-id"]
+        indexes = [
+            # old transitions are pruned by the worker
+            models.Index(fields=["created"], name="transition_created_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.entry_id}: {self.source} > {self.target}"
+
+
+class Job(models.Model):
+    task = models.CharField(_("Task"), max_length=50)
+    payload = models.JSONField(_("Payload"), default=dict)
+    status = models.CharField(
+        _("Status"),
+        max_length=2,
+        choices=JOB_STATUS,
+        default="PE",
+    )
+    progress = models.PositiveSmallIntegerField(
+        _("Progress"), default=0, help_text=_("Percent of work done")
+    )
+    error = models.TextField(_("Error"), null=True, blank=True)
+    created = models.DateTimeField(_("Created"), auto_now_add=True)
+    modified = models.DateTimeField(_("Modified"), auto_now=True)
+    # refreshed by the worker running the job
+    heartbeat = models.DateTimeField(_("Heartbeat"), null=True, editable=False)
+    attempts = models.PositiveSmallIntegerField(
+        _("Attempts"), default=0, editable=False
+    )
+
+    class Meta:
+        verbose_name = _("Job")
+        verbose_name_plural = _("Jobs")
+        ordering = ["id"]
+        indexes = [
+            models.Index(
+                fields=["id"], condition=Q(status="PE"), name="job_pending_idx"
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.task} ({self.id})"
+
+    def set_progress(self, done, total):
+        """Stores percent of work done without touching other fields"""
+        self.progress = int(done / total * 100) if total else 100
+        Job.objects.filter(id=self.id).update(
+            progress=self.progress, modified=timezone.now()
+        )
+
+
+class PartFile(File):
+    """Assembled upload, storages move it in place instead of copying"""
+
+    def temporary_file_path(self):
+        return self.file.name
+
+
+class Upload(models.Model):
+    """Resumable upload of a restored original, sent in chunks. Chunks
+    and finalization lock the part file while working on it, outside of
+    transactions, so that slow clients hold no database lock. File locks
+    need a POSIX system, and part files in FILE_UPLOAD_TEMP_DIR are seen
+    only by the host that got the chunks: with several hosts, chunks of an
+    upload must reach the same one (or a shared directory honouring flock)"""
+
+    entry = models.ForeignKey(Entry, on_delete=models.CASCADE, verbose_name=_("Entry"))
+    name = models.CharField(_("File name"), max_length=255)
+    size = models.PositiveBigIntegerField(_("Size"))
+    checksum = models.CharField(_("SHA-256 checksum"), max_length=64)
+    offset = models.PositiveBigIntegerField(_("Bytes received"), default=0)
+    created = models.DateTimeField(_("Created"), auto_now_add=True)
+    modified = models.DateTimeField(_("Modified"), auto_now=True)
+
+    class Meta:
+        verbose_name = _("Upload")
+        verbose_name_plural = _("Uploads")
+
+    def __str__(self):
+        return f"{self.name} ({self.offset}/{self.size})"
+
+    @property
+    def path(self):
+        return get_temp_dir() / f"upload-{self.id}.part"
+
+    def write_chunk(self, start, stream, length):
+        """Writes up to length bytes of stream at start, dropping whatever
+        followed it, returns number of bytes written. Returns None if
+        start is not the offset reached, or another chunk is being
+        written"""
+        self.path.touch(exist_ok=True)
+        with open(self.path, "r+b") as f:
+            if not lock_file(f, blocking=False):
+                return None
+            # offset only moves while the part file is locked
+            if not Upload.objects.filter(id=self.id, offset=start).exists():
+                return None
+            f.seek(start)
+            f.truncate()
+            while f.tell() < start + length:
+                block = stream.read(min(UPLOAD_BLOCK_SIZE, start + length - f.tell()))
+                if not block:
+                    break
+                f.write(block)
+            self.offset = f.tell()
+            Upload.objects.filter(id=self.id).update(
+                offset=self.offset, modified=timezone.now()
             )
-            return prev
-        except Entry.DoesNotExist:
-            return None
+        return self.offset - start
 
-    def get_next(self):
+    def get_checksum(self):
+        sha = hashlib.sha256()
+        with open(self.path, "rb") as f:
+            for block in iter(lambda: f.read(UPLOAD_BLOCK_SIZE), b""):
+                sha.update(block)
+        return sha.hexdigest()
+
+    def finalize(self):
+        """Checks assembled file and swaps it with entry image. Returns
+        False if a concurrent call finalized the upload first"""
         try:
-            next = Entry.objects.get(
-                folder=self.folder,
-                position=(self.position + 1),
-                status__in=["UP", "ST", "KI"],
-            )
-            return next
-        except Entry.DoesNotExist:
-            return None
+            f = open(self.path, "rb")
+        except FileNotFoundError:
+            if not Upload.objects.filter(id=self.id).exists():
+                return False
+            raise ValidationError(_("Upload is not complete"))
+        with f:
+            # waits for chunks being written and for concurrent calls
+            lock_file(f)
+            offset = Upload.objects.filter(id=self.id).values_list("offset", flat=True)
+            offset = offset.first()
+            if offset is None:
+                return False
+            if offset != self.size:
+                raise ValidationError(_("Upload is not complete"))
+            if self.get_checksum() != self.checksum:
+                raise ValidationError(_("Checksum mismatch"))
+            try:
+                with Image.open(self.path) as im:
+                    im.verify()
+            except Exception:
+                raise ValidationError(_("Uploaded file is not a valid image"))
+            restored = self.entry.restore_image(PartFile(f, name=self.name), self.name)
+            self.delete()
+        if not restored:
+            raise ValidationError(_("Entry was restored meanwhile"))
+        return True
+
+    def delete(self, *args, **kwargs):
+        self.path.unlink(missing_ok=True)
+        return super().delete(*args, **kwargs)
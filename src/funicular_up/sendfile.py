@@ -0,0 +1,130 @@
+"""Serving of protected files. Once the view has checked permissions, the
+transfer is handed to the front-end server as set by the
+FUNICULAR_UP_SENDFILE setting: "nginx" (X-Accel-Redirect to the internal
+location FUNICULAR_UP_SENDFILE_URL, mapped on MEDIA_ROOT) or "apache"
+(X-Sendfile). Otherwise Django streams the file, honouring Range and
+conditional requests, so that interrupted downloads can resume.
+
+Entry images are filer public files: the front-end server must not serve
+originals at MEDIA_URL (filer_public/), or anybody could fetch them
+bypassing permissions. Thumbnails (filer_public_thumbnails/) are shown
+in folder pages and stay public. With nginx, for instance:
+
+    location /media/filer_public/ { internal; alias /path/to/media/filer_public/; }
+    location /protected/ { internal; alias /path/to/media/; }
+"""
+
+import mimetypes
+import os
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.http import FileResponse, HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import content_disposition_header, http_date, parse_http_date
+
+RANGE = re.compile(r"^bytes=(\d*)-(\d*)$")
+SENDFILE_BACKENDS = (None, "nginx", "apache")
+
+
+class RangeFile:
+    """Reads at most length bytes of f, starting from start"""
+
+    def __init__(self, f, start, length):
+        f.seek(start)
+        self.f = f
+        self.remaining = length
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.f.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        self.f.close()
+
+
+def get_range(request, size, etag, last_modified):
+    """Returns (start, end) of a satisfiable single byte range, None to
+    send the whole file, raises ValueError if range is unsatisfiable"""
+    header = request.headers.get("Range")
+    if not header:
+        return None
+    if_range = request.headers.get("If-Range")
+    if if_range and if_range != etag:
+        # whole file if it changed since the client got its part
+        try:
+            if parse_http_date(if_range) != last_modified:
+                return None
+        except ValueError:
+            return None
+    match = RANGE.match(header.strip())
+    if not match or match.groups() == ("", ""):
+        # multiple or malformed ranges may be ignored
+        return None
+    first, last = match.groups()
+    if not first:
+        # suffix range, the last bytes of the file
+        start, end = max(size - int(last), 0), size - 1
+    else:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        raise ValueError("Range not satisfiable")
+    return start, end
+
+
+def serve_file(request, path, name):
+    """Returns a response sending file at path (inside MEDIA_ROOT) as
+    name, or a 304 / 412 response to conditional requests"""
+    stat = os.stat(path)
+    etag = f'"{stat.st_size:x}-{stat.st_mtime_ns:x}"'
+    last_modified = int(stat.st_mtime)
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is not None:
+        return response
+    content_type = mimetypes.guess_type(name)[0] or "application/octet-stream"
+    sendfile = getattr(settings, "FUNICULAR_UP_SENDFILE", None)
+    if sendfile not in SENDFILE_BACKENDS:
+        raise ImproperlyConfigured(
+            f"FUNICULAR_UP_SENDFILE must be one of {SENDFILE_BACKENDS}"
+        )
+    if sendfile:
+        # front-end server handles ranges and validators on its own
+        response = HttpResponse(content_type=content_type)
+        if sendfile == "nginx":
+            location = getattr(settings, "FUNICULAR_UP_SENDFILE_URL", "/protected/")
+            relative = os.path.relpath(path, settings.MEDIA_ROOT)
+            response["X-Accel-Redirect"] = location + quote(relative)
+        else:
+            response["X-Sendfile"] = path
+        response["Content-Disposition"] = content_disposition_header(False, name)
+    else:
+        try:
+            byte_range = get_range(request, stat.st_size, etag, last_modified)
+        except ValueError:
+            response = HttpResponse(status=416)
+            response["Content-Range"] = f"bytes */{stat.st_size}"
+            return response
+        f = open(path, "rb")
+        if byte_range:
+            start, end = byte_range
+            response = FileResponse(
+                RangeFile(f, start, end - start + 1),
+                status=206,
+                content_type=content_type,
+                filename=name,
+            )
+            response["Content-Length"] = end - start + 1
+            response["Content-Range"] = f"bytes {start}-{end}/{stat.st_size}"
+        else:
+            response = FileResponse(f, content_type=content_type, filename=name)
+        response["Accept-Ranges"] = "bytes"
+    response["ETag"] = etag
+    response["Last-Modified"] = http_date(last_modified)
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
@@ -6,6 +6,24 @@ function map_init(map, options) {
       }
     }
 
+    function pointToLayer(feature, latlng) {
+      // clusters show folder count and zoom in when clicked
+      if (feature.properties && feature.properties.count > 1) {
+        const marker = L.marker(latlng, {
+          icon: L.divIcon({
+            html: "<strong>" + feature.properties.count + "</strong>",
+            className: "fup-cluster",
+            iconSize: [32, 32],
+          })
+        });
+        marker.on("click", function () {
+          map.setView(latlng, map.getZoom() + 2);
+        });
+        return marker;
+      }
+      return L.marker(latlng);
+    }
+
     const base_map = L.tileLayer("https://{s}.tile.openstreetmap.org/{z}/{x}/{y}.png",
       {
         maxZoom: 19,
@@ -23,6 +41,45 @@ function map_init(map, options) {
       map.fitBounds(L.geoJson(collection).getBounds(), {padding: [30,30]});
     }
 
-    getCollections()
+    let request = 0;
+
+    function getClusters() {
+      // fetch clustered markers of visible area
+      const url = JSON.parse(document.getElementById("map_data_url").textContent);
+      const params = new URLSearchParams({
+        bbox: map.getBounds().toBBoxString(),
+        zoom: map.getZoom(),
+      });
+      const current = ++request;
+      fetch(url + "?" + params.toString())
+        .then(function (response) { return response.json(); })
+        .then(function (collection) {
+          // responses to earlier moves may arrive late
+          if (current !== request) {
+            return;
+          }
+          marker_layer.clearLayers();
+          L.geoJson(collection, {
+            onEachFeature: onEachFeature,
+            pointToLayer: pointToLayer,
+          }).addTo(marker_layer);
+        });
+    }
+
+    if (document.getElementById("map_data_url")) {
+      map.on("moveend", getClusters);
+      const bounds = JSON.parse(document.getElementById("map_bounds").textContent);
+      if (bounds) {
+        // moveend fetches clusters
+        map.fitBounds(
+          [[bounds.south, bounds.west], [bounds.north, bounds.east]],
+          {padding: [30,30], maxZoom: 15}
+        );
+      } else {
+        getClusters();
+      }
+    } else {
+      getCollections();
+    }
 
 }
@@ -0,0 +1,294 @@
+"""Background jobs, stored in the database and run by the funicular_worker
+management command, so no external broker is needed"""
+
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from pathlib import Path
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.files.move import file_move_safe
+from django.db import close_old_connections, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from filer.models import Image
+
+from .geocoding import geocode
+from .models import (
+    Blob,
+    Entry,
+    Folder,
+    Job,
+    PartFile,
+    Transition,
+    Upload,
+    get_temp_dir,
+)
+
+INGEST_THREADS = 4
+INGEST_BATCH_SIZE = 50
+THUMBNAIL_BATCH_SIZE = 50
+# running jobs without heartbeat for longer were lost by a dead worker
+JOB_TIMEOUT = timedelta(minutes=5)
+JOB_MAX_ATTEMPTS = 3
+JOB_KEEP = timedelta(days=7)
+UPLOAD_KEEP = timedelta(days=7)
+
+TASKS = {}
+
+
+def task(func):
+    """Registers func as a task, func receives the Job instance"""
+    TASKS[func.__name__] = func
+    return func
+
+
+def enqueue(name, **payload):
+    if name not in TASKS:
+        raise ValueError(f"Unknown task: {name}")
+    return Job.objects.create(task=name, payload=payload)
+
+
+def claim_jobs(limit):
+    """Moves up to limit pending jobs to running and returns their ids.
+    Claiming is a conditional update, so concurrent workers never run
+    the same job twice. Jobs lost by dead workers are claimed again"""
+    release_jobs(
+        Job.objects.filter(
+            Q(heartbeat__lt=timezone.now() - JOB_TIMEOUT) | Q(heartbeat=None)
+        ),
+        "Worker lost",
+    )
+    claimed = []
+    pending = Job.objects.filter(status="PE").values_list("id", flat=True)
+    for id in pending[:limit]:
+        if Job.objects.filter(id=id, status="PE").update(
+            status="RU", heartbeat=timezone.now(), attempts=F("attempts") + 1
+        ):
+            claimed.append(id)
+    return claimed
+
+
+class JobLost(Exception):
+    """The job was released while running, and maybe claimed again"""
+
+
+def claimed(job):
+    """Queryset of job as long as this run holds it: a job released and
+    claimed again has more attempts"""
+    return Job.objects.filter(id=job.id, status="RU", attempts=job.attempts)
+
+
+def beat_jobs(ids):
+    """Tells that the worker running jobs is alive"""
+    Job.objects.filter(id__in=ids, status="RU").update(heartbeat=timezone.now())
+
+
+def release_jobs(jobs, error):
+    """Running jobs among jobs are pending again, or failed with error
+    after JOB_MAX_ATTEMPTS"""
+    jobs = jobs.filter(status="RU")
+    jobs.filter(attempts__lt=JOB_MAX_ATTEMPTS).update(status="PE")
+    jobs.update(status="FA", error=error)
+
+
+def fail_job(id, error):
+    """Marks a job as failed when its worker could not do it"""
+    Job.objects.filter(id=id, status="RU").update(
+        status="FA", error=error, modified=timezone.now()
+    )
+
+
+def prune_jobs():
+    """Deletes jobs finished more than JOB_KEEP ago"""
+    return Job.objects.filter(
+        status__in=["DO", "FA"], modified__lt=timezone.now() - JOB_KEEP
+    ).delete()[0]
+
+
+def prune_transitions():
+    """Deletes transitions logged more than FUNICULAR_UP_TRANSITION_KEEP
+    days ago (90 by default)"""
+    days = getattr(settings, "FUNICULAR_UP_TRANSITION_KEEP", 90)
+    return Transition.objects.filter(
+        created__lt=timezone.now() - timedelta(days=days)
+    ).delete()[0]
+
+
+def expire_uploads():
+    """Deletes uploads untouched for UPLOAD_KEEP, or whose entry is not
+    requested anymore, and part files left without upload"""
+    expired = Upload.objects.filter(
+        Q(modified__lt=timezone.now() - UPLOAD_KEEP) | ~Q(entry__status="RQ")
+    )
+    for upload in expired:
+        upload.delete()
+    ids = set(Upload.objects.values_list("id", flat=True))
+    deadline = (timezone.now() - UPLOAD_KEEP).timestamp()
+    for path in get_temp_dir().glob("upload-*.part"):
+        id = path.stem.removeprefix("upload-")
+        if id.isdigit() and int(id) not in ids and path.stat().st_mtime < deadline:
+            path.unlink(missing_ok=True)
+
+
+def run_job(id):
+    """Runs a claimed job, called inside worker processes"""
+    close_old_connections()
+    job = Job.objects.get(id=id)
+    try:
+        TASKS[job.task](job)
+    except Exception:
+        job.status = "FA"
+        job.error = traceback.format_exc()
+    else:
+        job.status = "DO"
+        job.progress = 100
+        job.error = None
+    fields = {"status": job.status, "progress": job.progress, "error": job.error}
+    if not claimed(job).update(**fields, modified=timezone.now()):
+        # released meanwhile, the worker running it now has the last word
+        job.refresh_from_db()
+    return job
+
+
+@task
+def downscale_images(job):
+    """Replaces originals of downloaded entries with small previews"""
+    ids = job.payload["ids"]
+    entries = Entry.objects.filter(id__in=ids, status="DW").select_related("image")
+    for i, entry in enumerate(entries, start=1):
+        entry.downscale_image()
+        job.set_progress(i, len(ids))
+
+
+def stage_file(f):
+    """Moves (or streams) an uploaded file to the temp dir, where ingest
+    jobs pick it up, returns its path and name. The digest is left to the
+    job, filer computes it while reading the file"""
+    path = get_temp_dir() / f"ingest-{uuid4().hex}{Path(f.name).suffix}"
+    if hasattr(f, "temporary_file_path"):
+        file_move_safe(f.temporary_file_path(), path)
+    else:
+        with open(path, "wb") as staged:
+            for chunk in f.chunks():
+                staged.write(chunk)
+    return str(path), f.name
+
+
+def read_image(staged):
+    """Instantiating a filer Image reads size, SHA-1 digest and dimensions,
+    no database access is involved. Caller closes the file once saved"""
+    path, name = staged[:2]
+    f = open(path, "rb")
+    return Image(file=PartFile(f, name=name), original_filename=name), f
+
+
+def store_batch(pool, job, batch):
+    """Stores staged files whose content is not held by a blob yet.
+    Digests are appended to the files of the job payload before files are
+    moved to storage, so that a resumed job finds the ones stored by an
+    interrupted run. Returns (path, digest) of files with a digest"""
+    staged = [file for file in batch if Path(file[0]).exists()]
+    read = list(pool.map(read_image, staged))
+    try:
+        digests = {}
+        for file, (image, _) in zip(staged, read):
+            if len(file) < 3:
+                file.append(image.sha1)
+            digests[image.sha1] = image
+        if digests and not claimed(job).update(payload=job.payload):
+            raise JobLost(f"Job {job.id} released while running")
+        stored = Blob.get_images(digests)
+        for digest, image in digests.items():
+            if digest not in stored:
+                Blob.add(image, digest)
+    finally:
+        for _, f in read:
+            f.close()
+    for path, _, *digest in batch:
+        if digest and digest[0] not in digests:
+            # moved to storage by an interrupted run, before its blob was added
+            image = Image.objects.filter(
+                sha1=digest[0], blob=None, entry_image=None
+            ).first()
+            if image:
+                Blob.objects.get_or_create(digest=digest[0], defaults={"image": image})
+    return [(file[0], file[2]) for file in batch if len(file) > 2]
+
+
+@task
+def ingest_images(job):
+    """Stores staged uploads and appends them to folder as entries, a
+    batch at a time. Uploads with the content of a stored blob are linked
+    to its image. Entries of a batch are added together with the number
+    of files done, so a failed job resumes after the last batch added"""
+    folder = Folder.objects.get(id=job.payload["folder"])
+    files = job.payload["files"]
+    with ThreadPoolExecutor(INGEST_THREADS) as pool:
+        # read in batches, to bound the number of open files
+        for i in range(job.payload.get("done", 0), len(files), INGEST_BATCH_SIZE):
+            batch = files[i : i + INGEST_BATCH_SIZE]
+            while True:
+                digests = store_batch(pool, job, batch)
+                with transaction.atomic():
+                    images = Blob.get_images([d for _, d in digests], lock=True)
+                    if any(
+                        digest not in images and Path(path).exists()
+                        for path, digest in digests
+                    ):
+                        # a blob was downscaled meanwhile, store it again
+                        continue
+                    entries = folder.add_entries(
+                        [images[d] for _, d in digests if d in images]
+                    )
+                    job.payload["done"] = i + len(batch)
+                    if not claimed(job).update(payload=job.payload):
+                        # entries are added by the run holding the job
+                        raise JobLost(f"Job {job.id} released while running")
+                break
+            for path, *_ in batch:
+                # stored files were moved already, duplicates are dropped
+                Path(path).unlink(missing_ok=True)
+            enqueue_thumbnails([entry.id for entry in entries])
+            job.set_progress(job.payload["done"], len(files))
+
+
+def enqueue_thumbnails(ids):
+    """A job for each batch of entries, so that worker processes share
+    the work"""
+    return [
+        enqueue("thumbnail_entries", ids=ids[i : i + THUMBNAIL_BATCH_SIZE])
+        for i in range(0, len(ids), THUMBNAIL_BATCH_SIZE)
+    ]
+
+
+def make_thumbnails(ids, job=None):
+    """Generates thumbnails of entries, returns their number. Called by
+    jobs and by the funicular_thumbnails management command"""
+    close_old_connections()
+    entries = Entry.objects.filter(id__in=ids).select_related("image")
+    for i, entry in enumerate(entries, start=1):
+        entry.make_thumbnail()
+        if job:
+            job.set_progress(i, len(ids))
+    # folder pages cached by browsers showed placeholders
+    folders = {entry.folder_id for entry in entries}
+    Folder.objects.filter(id__in=folders).update(modified=timezone.now())
+    return len(entries)
+
+
+@task
+def thumbnail_entries(job):
+    """Generates thumbnails of uploaded or restored entries"""
+    make_thumbnails(job.payload["ids"], job)
+
+
+@task
+def geocode_folder(job):
+    """Sets folder location from address"""
+    folder = Folder.objects.get(id=job.payload["folder"])
+    geom = geocode(job.payload["address"]).geom
+    if geom:
+        folder.geom = geom
+        folder.save(update_fields=["geom"])
@@ -2,10 +2,12 @@ from django.urls import path
 from django.views.generic import RedirectView
 
 from .views import (
+    EntriesDownloaded,
     EntryCaptionUpdateView,
     EntryDetailRedirectView,
     EntryDetailView,
     EntryDownloaded,
+    EntryImageView,
     EntryStatusDetailView,
     EntryUpdateAPIView,
     FolderCreateView,
@@ -13,24 +15,44 @@ from .views import (
     FolderDetailView,
     FolderInitialCreateView,
     FolderListView,
+    FolderMapDataView,
     FolderMapListView,
     FolderRequestAllDetailView,
+    FolderRequestAPIView,
     FolderUpdateView,
     FolderUploadView,
+    JobDetailAPIView,
+    JobProgressView,
+    RestoreDigestAPIView,
+    SendChanges,
     SendStatus,
+    StreamStatus,
+    UploadChunkAPIView,
+    UploadFinalizeAPIView,
+    UploadStartAPIView,
+    async_entry_downloaded,
+    async_entry_upload,
+    async_send_status,
+    async_stream_status,
     entry_delete_view,
     entry_sort_view,
     folder_delete_view,
+    folder_entries_view,
+    notifications_view,
     search_results_view,
+    search_typeahead_view,
+    wait_changes_view,
 )
 
 app_name = "funicular_up"
 urlpatterns = [
     path("", RedirectView.as_view(pattern_name="funicular_up:folder_list")),
     path("search/", search_results_view, name="search_results"),
+    path("search/typeahead/", search_typeahead_view, name="search_typeahead"),
     path("folder/", FolderListView.as_view(), name="folder_list"),
     path("folder/date/", FolderDateListView.as_view(), name="folder_list_date"),
     path("folder/map/", FolderMapListView.as_view(), name="folder_list_map"),
+    path("folder/map/data/", FolderMapDataView.as_view(), name="folder_map_data"),
     path("folder/create/", FolderCreateView.as_view(), name="folder_create"),
     path("folder/<pk>/", FolderDetailView.as_view(), name="folder_detail"),
     path(
@@ -51,17 +73,59 @@ urlpatterns = [
     ),
     path("folder/<pk>/delete/", folder_delete_view, name="folder_delete"),
     path("folder/<pk>/sort/", entry_sort_view, name="entry_sort"),
+    path("folder/<pk>/entries/", folder_entries_view, name="folder_entries"),
+    path("job/<pk>/progress/", JobProgressView.as_view(), name="job_progress"),
     path("entry/<pk>/", EntryDetailRedirectView.as_view(), name="entry_detail"),
     path(
         "entry/<pk>/available/",
         EntryDetailView.as_view(),
         name="entry_detail_available",
     ),
+    path("entry/<pk>/image/", EntryImageView.as_view(), name="entry_image"),
     path("entry/<pk>/caption/", EntryCaptionUpdateView.as_view(), name="entry_caption"),
     path("entry/<pk>/status/", EntryStatusDetailView.as_view(), name="entry_status"),
     path("entry/<pk>/delete/", entry_delete_view, name="entry_delete"),
     # API views
+    path(
+        "folder/<pk>/request/api/",
+        FolderRequestAPIView.as_view(),
+        name="folder_request_api",
+    ),
     path("status/", SendStatus.as_view(), name="send_status"),
+    path("status/changes/", SendChanges.as_view(), name="send_changes"),
+    path("status/stream/", StreamStatus.as_view(), name="stream_status"),
     path("entry/<pk>/download/", EntryDownloaded.as_view(), name="entry_download"),
     path("entry/<pk>/upload/", EntryUpdateAPIView.as_view(), name="entry_upload"),
+    path("entry/<pk>/restore/", UploadStartAPIView.as_view(), name="upload_start"),
+    path(
+        "entry/<pk>/restore/<digest>/",
+        RestoreDigestAPIView.as_view(),
+        name="restore_digest",
+    ),
+    path("upload/<pk>/", UploadChunkAPIView.as_view(), name="upload_chunk"),
+    path(
+        "upload/<pk>/finalize/",
+        UploadFinalizeAPIView.as_view(),
+        name="upload_finalize",
+    ),
+    path("async/status/", async_send_status, name="async_send_status"),
+    path("async/status/stream/", async_stream_status, name="async_stream_status"),
+    path("async/status/wait/", wait_changes_view, name="wait_changes"),
+    path(
+        "async/status/notifications/",
+        notifications_view,
+        name="status_notifications",
+    ),
+    path(
+        "async/entry/<int:pk>/download/",
+        async_entry_downloaded,
+        name="async_entry_download",
+    ),
+    path(
+        "async/entry/<int:pk>/upload/",
+        async_entry_upload,
+        name="async_entry_upload",
+    ),
+    path("entries/download/", EntriesDownloaded.as_view(), name="entries_download"),
+    path("job/<pk>/", JobDetailAPIView.as_view(), name="job_detail"),
 ]
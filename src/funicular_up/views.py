@@ -1,12 +1,46 @@
+import asyncio
+import hashlib
+import json
+import math
+import os
+import re
+from datetime import datetime, timedelta, timezone
+from functools import wraps
+from io import BytesIO
+
+from asgiref.sync import sync_to_async
 from django import forms
-from django.contrib.auth.decorators import permission_required
+from django.contrib.auth.decorators import login_required, permission_required
 from django.contrib.auth.mixins import LoginRequiredMixin, PermissionRequiredMixin
-from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
+from django.contrib.postgres.search import (
+    SearchQuery,
+    SearchRank,
+    TrigramWordSimilarity,
+)
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.db import OperationalError, connection, transaction
+from django.db.models import Avg, Count, F, Max, Min, Q
+from django.db.models.functions import Floor, TruncMonth
 from django.forms import ModelForm
-from django.http import Http404, HttpResponseRedirect
+from django.http import (
+    Http404,
+    HttpResponseNotAllowed,
+    HttpResponseRedirect,
+    JsonResponse,
+    StreamingHttpResponse,
+)
 from django.shortcuts import get_object_or_404
 from django.template.response import TemplateResponse
 from django.urls import reverse
+from django.utils.cache import (
+    get_conditional_response,
+    patch_cache_control,
+    patch_vary_headers,
+)
+from django.utils.http import http_date
+from django.utils.translation import get_language
+from django.views.decorators.csrf import csrf_exempt
 from django.views.generic import (
     CreateView,
     DetailView,
@@ -14,18 +48,62 @@ from django.views.generic import (
     ListView,
     RedirectView,
     UpdateView,
+    View,
 )
-from filer.models import Image
-from geopy.exc import GeocoderTimedOut
-from geopy.geocoders import Nominatim
 from rest_framework import serializers
-from rest_framework.generics import RetrieveAPIView, UpdateAPIView
+from rest_framework.authentication import SessionAuthentication
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.generics import (
+    CreateAPIView,
+    GenericAPIView,
+    RetrieveAPIView,
+    UpdateAPIView,
+)
 from rest_framework.parsers import MultiPartParser
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.request import Request
 from rest_framework.response import Response
+from rest_framework.settings import api_settings
 from rest_framework.views import APIView
 
-from .models import Entry, Folder, show_folder_tree
+from .broker import get_broker
+from .geocoding import get_cached
+from .models import (
+    PENDING,
+    Blob,
+    DeletedEntry,
+    Entry,
+    Folder,
+    Job,
+    Upload,
+    get_folder_map_version,
+    get_folder_tree_version,
+    show_folder_tree,
+)
+from .sendfile import serve_file
+from .tasks import enqueue, enqueue_thumbnails, stage_file
+
+CHANGES_LIMIT = 500
+CHANGES_MAX_LIMIT = 5000
+STREAM_CHUNK_SIZE = 2000
+BATCH_MAX_SIZE = 1000
+SEARCH_LIMIT = 50
+DATE_PAGE_SIZE = 100
+ENTRY_PAGE_SIZE = 48
+TYPEAHEAD_LIMIT = 8
+TYPEAHEAD_MIN_LENGTH = 3
+TYPEAHEAD_TIMEOUT = 200
+TYPEAHEAD_CACHE_TIMEOUT = 30
+# seconds before a missing thumbnail is enqueued again
+THUMBNAIL_QUEUE_TIMEOUT = 60 * 10
+MAP_MAX_ZOOM = 19
+MAP_CELLS_PER_TILE = 4
+MAP_CACHE_TIMEOUT = 60 * 60
+WAIT_TIMEOUT = 30
+WAIT_MAX_TIMEOUT = 300
+SSE_KEEPALIVE = 15
+# longest time between modification and commit of an entry change
+CHANGES_SETTLE = timedelta(seconds=30)
 
 
 class FolderCreateForm(ModelForm):
@@ -38,13 +116,73 @@ class FolderCreateForm(ModelForm):
         fields = ("parent", "name", "description", "date")
 
 
-class FolderListView(LoginRequiredMixin, ListView):
+class ConditionalMixin:
+    """Answers conditional GETs with 304 before objects are fetched and
+    templates rendered, comparing validators from get_validators"""
+
+    def get_validators(self):
+        """Returns a list of values that change with the page and its last
+        modification time (or None), or None if the page can't be validated.
+        Last modification is given only where deletions change it too"""
+        return None
+
+    def get(self, request, *args, **kwargs):
+        validators = self.get_validators()
+        if validators is None:
+            return super().get(request, *args, **kwargs)
+        values, last_modified = validators
+        # pages sharing validators (a folder and its entries, further pages
+        # of a list) must not share etags
+        values += [
+            request.resolver_match.view_name,
+            sorted(self.kwargs.items()),
+            sorted(request.GET.lists()),
+        ]
+        # same url renders a fragment or a full page, depending on user
+        values += [request.user.pk, "Hx-Request" in request.headers, get_language()]
+        # pages embed the csrf token, which is rotated on login
+        values.append(request.META.get("CSRF_COOKIE"))
+        etag = f'"{hashlib.md5(str(values).encode()).hexdigest()}"'
+        if last_modified:
+            last_modified = int(last_modified.timestamp())
+        response = get_conditional_response(
+            request, etag=etag, last_modified=last_modified
+        )
+        if response is None:
+            response = super().get(request, *args, **kwargs)
+        response["ETag"] = etag
+        if last_modified:
+            response["Last-Modified"] = http_date(last_modified)
+        patch_vary_headers(response, ["HX-Request"])
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
+
+
+def folder_validators(folder_id):
+    """Validators of pages showing a folder with its entries, subfolders
+    and ancestors (the latter two change the tree cache version)"""
+    row = (
+        Folder.objects.filter(id=folder_id)
+        .annotate(entries_modified=Max("entry__modified"))
+        .values_list("modified", "entries_modified")
+        .first()
+    )
+    if row is None:
+        return None
+    last_modified = max(filter(None, row))
+    return [get_folder_tree_version(), last_modified.isoformat()], last_modified
+
+
+class FolderListView(LoginRequiredMixin, ConditionalMixin, ListView):
     model = Folder
     template_name = "funicular_up/folder_list.html"
 
+    def get_validators(self):
+        return [get_folder_tree_version()], None
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context["tree"] = show_folder_tree(context["object_list"].with_tree_fields())
+        context["tree"] = show_folder_tree()
         return context
 
     def get_template_names(self):
@@ -53,35 +191,210 @@ class FolderListView(LoginRequiredMixin, ListView):
         return super().get_template_names()
 
 
-class FolderDateListView(LoginRequiredMixin, ListView):
+class FolderDateListView(LoginRequiredMixin, ConditionalMixin, ListView):
+    """Dated folders, newest first. Further pages are loaded by HTMX
+    when scrolling, passing the (date, id) cursor of the last folder
+    shown. Month links jump to the folders of that month"""
+
     model = Folder
     template_name = "funicular_up/folder_list_date.html"
 
+    def get_validators(self):
+        # folder saves and deletions change the tree cache version
+        return [get_folder_tree_version()], None
+
     def get_queryset(self):
-        qs = Folder.objects.exclude(date=None).order_by("-date")
+        qs = Folder.objects.exclude(date=None).order_by("-date", "-id")
+        try:
+            if "cursor" in self.request.GET:
+                date, id = self.request.GET["cursor"].split("_")
+                date, id = datetime.strptime(date, "%Y-%m-%d").date(), int(id)
+                qs = qs.filter(Q(date__lt=date) | Q(date=date, id__lt=id))
+            elif "month" in self.request.GET:
+                month = datetime.strptime(self.request.GET["month"], "%Y-%m").date()
+                # first day of next month
+                month = (month + timedelta(days=31)).replace(day=1)
+                qs = qs.filter(date__lt=month)
+        except ValueError:
+            raise Http404("Invalid cursor")
         return qs
 
+    def get_context_data(self, **kwargs):
+        # one more row tells if there is a further page
+        rows = list(self.object_list[: DATE_PAGE_SIZE + 1])
+        context = super().get_context_data(object_list=rows[:DATE_PAGE_SIZE], **kwargs)
+        if len(rows) > DATE_PAGE_SIZE:
+            last = rows[DATE_PAGE_SIZE - 1]
+            context["next_cursor"] = f"{last.date.isoformat()}_{last.id}"
+        if "cursor" not in self.request.GET:
+            months = (
+                Folder.objects.exclude(date=None)
+                .annotate(month=TruncMonth("date"))
+                .values("month")
+                .annotate(count=Count("id"))
+                .order_by("-month")
+            )
+            years = {}
+            for month in months:
+                year = years.setdefault(month["month"].year, {"count": 0, "months": []})
+                year["count"] += month["count"]
+                year["months"].append(month)
+            context["years"] = years
+        return context
+
     def get_template_names(self):
         if "Hx-Request" in self.request.headers:
+            if "cursor" in self.request.GET:
+                return ["funicular_up/htmx/folder_list_date_rows.html"]
             return ["funicular_up/htmx/folder_list_date.html"]
         return super().get_template_names()
 
 
-class FolderMapListView(LoginRequiredMixin, ListView):
+class FolderMapListView(LoginRequiredMixin, ConditionalMixin, ListView):
     model = Folder
     template_name = "funicular_up/folder_list_map.html"
 
+    def get_validators(self):
+        return [get_folder_map_version()], None
+
     def get_queryset(self):
         qs = Folder.objects.exclude(geom=None)
         return qs
 
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        # markers are fetched by map script, only extent is needed here
+        bounds = Folder.objects.filter(longitude__isnull=False).aggregate(
+            west=Min("longitude"),
+            south=Min("latitude"),
+            east=Max("longitude"),
+            north=Max("latitude"),
+        )
+        context["map_bounds"] = bounds if bounds["west"] is not None else None
+        context["map_data_url"] = reverse("funicular_up:folder_map_data")
+        return context
+
     def get_template_names(self):
         if "Hx-Request" in self.request.headers:
             return ["funicular_up/htmx/folder_list_map.html"]
         return super().get_template_names()
 
 
-class FolderCreateView(PermissionRequiredMixin, CreateView):
+class GeolocateMixin:
+    """Folder is saved right away, address is geocoded from cache or by a
+    background job"""
+
+    def form_valid(self, form):
+        address = form.cleaned_data["address"]
+        cached = get_cached(address) if address else None
+        if cached and cached.geom:
+            form.instance.geom = cached.geom
+        response = super().form_valid(form)
+        if address and not cached:
+            enqueue("geocode_folder", folder=self.object.id, address=address)
+        return response
+
+
+class MapQueryForm(forms.Form):
+    bbox = forms.CharField()
+    zoom = forms.IntegerField(min_value=0, max_value=MAP_MAX_ZOOM)
+
+    def clean_bbox(self):
+        try:
+            west, south, east, north = (
+                float(c) for c in self.cleaned_data["bbox"].split(",")
+            )
+        except ValueError:
+            raise forms.ValidationError("Expected west,south,east,north")
+        if not all(math.isfinite(c) for c in (west, south, east, north)):
+            raise forms.ValidationError("Coordinates must be finite numbers")
+        if west > east or south > north:
+            raise forms.ValidationError("Expected west,south,east,north")
+        return max(west, -180), max(south, -90), min(east, 180), min(north, 90)
+
+
+def map_cluster_features(zoom, west, south, east, north):
+    """Groups geolocated folders in bbox on a grid depending on zoom, with
+    a single GROUP BY query. Lone folders are returned as they are"""
+    cell = 360 / (2**zoom * MAP_CELLS_PER_TILE)
+    folders = Folder.objects.filter(
+        longitude__gte=west,
+        longitude__lte=east,
+        latitude__gte=south,
+        latitude__lte=north,
+    )
+    cells = (
+        folders.annotate(
+            cell_x=Floor(F("longitude") / cell), cell_y=Floor(F("latitude") / cell)
+        )
+        .values("cell_x", "cell_y")
+        .annotate(
+            count=Count("id"),
+            longitude=Avg("longitude"),
+            latitude=Avg("latitude"),
+            first=Min("id"),
+        )
+        .order_by()
+    )
+    features = []
+    lone = []
+    for c in cells:
+        if c["count"] == 1:
+            lone.append(c["first"])
+            continue
+        features.append(
+            {
+                "type": "Feature",
+                "geometry": {
+                    "type": "Point",
+                    "coordinates": [c["longitude"], c["latitude"]],
+                },
+                "properties": {"count": c["count"]},
+            }
+        )
+    for folder in Folder.objects.filter(id__in=lone):
+        features.append(
+            {
+                "type": "Feature",
+                "geometry": folder.geom,
+                "properties": {"count": 1, "popupContent": folder.popupContent},
+            }
+        )
+    return features
+
+
+class FolderMapDataView(LoginRequiredMixin, View):
+    """GeoJSON of folders in the map bounding box, clustered by zoom.
+    Bounding box is snapped to the cluster grid, so responses are cached
+    and revalidated with ETags across small map moves"""
+
+    def get(self, request, *args, **kwargs):
+        form = MapQueryForm(request.GET)
+        if not form.is_valid():
+            return JsonResponse(form.errors, status=400)
+        zoom = form.cleaned_data["zoom"]
+        cell = 360 / (2**zoom * MAP_CELLS_PER_TILE)
+        west, south, east, north = (
+            math.floor(c / cell) * cell if i < 2 else math.ceil(c / cell) * cell
+            for i, c in enumerate(form.cleaned_data["bbox"])
+        )
+        key = hashlib.md5(
+            f"{get_folder_map_version()}_{zoom}_{west}_{south}_{east}_{north}".encode()
+        ).hexdigest()
+        etag = f'"{key}"'
+        response = get_conditional_response(request, etag=etag)
+        if response:
+            return response
+        features = cache.get(f"funicular_up_map_{key}")
+        if features is None:
+            features = map_cluster_features(zoom, west, south, east, north)
+            cache.set(f"funicular_up_map_{key}", features, MAP_CACHE_TIMEOUT)
+        response = JsonResponse({"type": "FeatureCollection", "features": features})
+        response["ETag"] = etag
+        return response
+
+
+class FolderCreateView(PermissionRequiredMixin, GeolocateMixin, CreateView):
     permission_required = "funicular_up.add_folder"
     model = Folder
     template_name = "funicular_up/folder_create.html"
@@ -92,20 +405,6 @@ class FolderCreateView(PermissionRequiredMixin, CreateView):
             return ["funicular_up/htmx/folder_create.html"]
         return super().get_template_names()
 
-    def form_valid(self, form):
-        if form.cleaned_data["address"]:
-            geolocator = Nominatim(user_agent="andywar65_funicular_up")
-            try:
-                loc = geolocator.geocode(form.cleaned_data["address"])
-                if loc.longitude and loc.latitude:
-                    form.instance.geom = {
-                        "type": "Point",
-                        "coordinates": [loc.longitude, loc.latitude],
-                    }
-            except GeocoderTimedOut:
-                pass
-        return super().form_valid(form)
-
     def get_success_url(self):
         return reverse("funicular_up:folder_detail", kwargs={"pk": self.object.id})
 
@@ -118,7 +417,7 @@ class FolderInitialCreateView(FolderCreateView):
         return initial
 
 
-class FolderUpdateView(PermissionRequiredMixin, UpdateView):
+class FolderUpdateView(PermissionRequiredMixin, GeolocateMixin, UpdateView):
     permission_required = "funicular_up.change_folder"
     model = Folder
     template_name = "funicular_up/folder_update.html"
@@ -129,28 +428,57 @@ class FolderUpdateView(PermissionRequiredMixin, UpdateView):
             return ["funicular_up/htmx/folder_update.html"]
         return super().get_template_names()
 
-    def form_valid(self, form):
-        if form.cleaned_data["address"]:
-            geolocator = Nominatim(user_agent="andywar65_funicular_up")
-            try:
-                loc = geolocator.geocode(form.cleaned_data["address"])
-                if loc.longitude and loc.latitude:
-                    form.instance.geom = {
-                        "type": "Point",
-                        "coordinates": [loc.longitude, loc.latitude],
-                    }
-            except GeocoderTimedOut:
-                pass
-        return super().form_valid(form)
-
     def get_success_url(self):
         return reverse("funicular_up:folder_detail", kwargs={"pk": self.object.id})
 
 
-class FolderDetailView(LoginRequiredMixin, DetailView):
+def entry_page(folder, cursor=None, size=ENTRY_PAGE_SIZE):
+    """Returns a page of folder entries, with their images fetched by the
+    same query, and the (position, id) cursor of next page, if any"""
+    entries = folder.entry_set.select_related("image")
+    if cursor:
+        try:
+            position, id = (int(i) for i in cursor.split("_"))
+        except ValueError:
+            raise Http404("Invalid cursor")
+        entries = entries.filter(
+            Q(position__gt=position) | Q(position=position, id__gt=id)
+        )
+    entries = list(entries[: size + 1])
+    queue_thumbnails(entries[:size])
+    if len(entries) > size:
+        last = entries[size - 1]
+        return entries[:size], f"{last.position}_{last.id}"
+    return entries, None
+
+
+def queue_thumbnails(entries):
+    """Enqueues thumbnails missing from entries, which show a placeholder
+    meanwhile. Entries are queued once in THUMBNAIL_QUEUE_TIMEOUT"""
+    keys = {
+        f"funicular_up_thumbnail_{entry.id}": entry.id
+        for entry in entries
+        if entry.image_id and not entry.thumbnail
+    }
+    if not keys:
+        return
+    queued = cache.get_many(keys)
+    keys = {key: id for key, id in keys.items() if key not in queued}
+    if keys:
+        cache.set_many(dict.fromkeys(keys, True), THUMBNAIL_QUEUE_TIMEOUT)
+        enqueue_thumbnails(list(keys.values()))
+
+
+class FolderDetailView(LoginRequiredMixin, ConditionalMixin, DetailView):
     model = Folder
     template_name = "funicular_up/folder_detail.html"
 
+    def get_validators(self):
+        return folder_validators(self.kwargs["pk"])
+
+    def get_queryset(self):
+        return super().get_queryset().annotate(entry_count=Count("entry"))
+
     def get_template_names(self):
         if "Hx-Request" in self.request.headers:
             return ["funicular_up/htmx/folder_detail.html"]
@@ -158,19 +486,49 @@ class FolderDetailView(LoginRequiredMixin, DetailView):
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context["tree"] = show_folder_tree(self.object.descendants().with_tree_fields())
+        context["tree"] = show_folder_tree(self.object)
+        context["ancestors"] = list(self.object.ancestors())
+        context["entries"], context["next_cursor"] = entry_page(self.object)
         return context
 
 
+@login_required
+def folder_entries_view(request, pk):
+    """Renders next page of entries, loaded by HTMX when the end of
+    #sortable-entries is revealed"""
+    if "Hx-Request" not in request.headers:
+        raise Http404("Request without HTMX headers")
+    folder = get_object_or_404(Folder, id=pk)
+    entries, next_cursor = entry_page(folder, request.GET.get("cursor"))
+    template_name = "funicular_up/htmx/folder_sortable.html"
+    context = {"object": folder, "entries": entries, "next_cursor": next_cursor}
+    return TemplateResponse(request, template_name, context)
+
+
+class RequestAllQuerySerializer(serializers.Serializer):
+    subfolders = serializers.BooleanField(default=False)
+
+
 class FolderRequestAllDetailView(FolderDetailView):
 
+    def get_validators(self):
+        # entries are requested on each visit
+        return None
+
     def get_object(self, queryset=None):
         obj = super().get_object(queryset)
-        for entry in obj.entry_set.filter(status="DW"):
-            entry.status = "RQ"
-            entry.save()
+        # parsed as the subfolders field of the API, so "false" means false
+        query = RequestAllQuerySerializer(data=self.request.GET)
+        if not query.is_valid():
+            raise Http404("Invalid subfolders")
+        self.requested = obj.request_all(**query.validated_data)
         return obj
 
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context["requested"] = self.requested
+        return context
+
 
 class MultipleFileInput(forms.ClearableFileInput):
     allow_multiple_selected = True
@@ -214,20 +572,31 @@ class FolderUploadView(PermissionRequiredMixin, FormView):
         return super().get_template_names()
 
     def form_valid(self, form):
-        last = self.object.entry_set.last()
-        if last and last.position:
-            pos = last.position + 1
-        else:
-            pos = 1
-        files = form.cleaned_data["file_field"]
-        for f in files:
-            image = Image.objects.create(file=f)
-            Entry.objects.create(folder=self.object, image=image, position=pos)
-            pos += 1
+        files = [stage_file(f) for f in form.cleaned_data["file_field"]]
+        self.job = enqueue("ingest_images", folder=self.object.id, files=files)
         return super().form_valid(form)
 
     def get_success_url(self):
-        return reverse("funicular_up:folder_detail", kwargs={"pk": self.object.id})
+        return reverse("funicular_up:job_progress", kwargs={"pk": self.job.id})
+
+
+class JobProgressView(PermissionRequiredMixin, DetailView):
+    permission_required = "funicular_up.change_folder"
+    model = Job
+    template_name = "funicular_up/job_progress.html"
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        if "folder" in self.object.payload:
+            context["folder"] = Folder.objects.filter(
+                id=self.object.payload["folder"]
+            ).first()
+        return context
+
+    def get_template_names(self):
+        if "Hx-Request" in self.request.headers:
+            return ["funicular_up/htmx/job_progress.html"]
+        return super().get_template_names()
 
 
 @permission_required("funicular_up.delete_folder")
@@ -274,21 +643,32 @@ class EntryDetailRedirectView(LoginRequiredMixin, RedirectView):
         return response
 
 
-class EntryDetailView(LoginRequiredMixin, DetailView):
+class EntryDetailView(LoginRequiredMixin, ConditionalMixin, DetailView):
     model = Entry
     template_name = "funicular_up/entry_detail.html"
 
+    def get_validators(self):
+        entry = Entry.objects.filter(id=self.kwargs["pk"]).values("folder", "status")
+        entry = entry.first()
+        if entry is None or entry["status"] == "ST":
+            # restored entries change status when viewed
+            return None
+        # neighbours depend on the other entries of the folder
+        return folder_validators(entry["folder"])
+
+    def get_queryset(self):
+        return super().get_queryset().select_related("image", "folder")
+
     def get_object(self, queryset=None):
-        obj = super().get_object(queryset)
-        if obj.status == "ST":
-            obj.status = "KI"
-            obj.save()
-        return obj
+        entry = super().get_object(queryset)
+        # restored entries are killed on server once seen
+        if entry.status == "ST" and Entry.objects.filter(id=entry.id).transition("KI"):
+            entry.status = "KI"
+        return entry
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context["previous"] = self.object.get_previous()
-        context["next"] = self.object.get_next()
+        context["previous"], context["next"] = self.object.get_neighbours()
         return context
 
     def get_template_names(self):
@@ -303,11 +683,10 @@ class EntryStatusDetailView(LoginRequiredMixin, DetailView):
     context_object_name = "entry"
 
     def get_object(self, queryset=None):
-        obj = super().get_object(queryset)
-        if obj.status == "DW":
-            obj.status = "RQ"
-            obj.save()
-        return obj
+        entry = super().get_object(queryset)
+        if entry.status == "DW" and Entry.objects.filter(id=entry.id).transition("RQ"):
+            entry.status = "RQ"
+        return entry
 
     def get_template_names(self):
         if "Hx-Request" not in self.request.headers:
@@ -351,9 +730,6 @@ def entry_delete_view(request, pk):
         raise Http404("Request without HTMX headers")
     entry = get_object_or_404(Entry, id=pk)
     folder = entry.folder
-    for follower in folder.entry_set.filter(position__gt=entry.position):
-        follower.position -= 1
-        follower.save()
     entry.delete()
     return HttpResponseRedirect(
         reverse("funicular_up:entry_sort", kwargs={"pk": folder.id})
@@ -371,17 +747,13 @@ def entry_sort_view(request, pk):
     elif not request.headers["Hx-Request"] == "true":
         raise Http404("Request without HTMX headers")
     folder = get_object_or_404(Folder, id=pk)
-    if "entry_list" in request.POST:
-        i = 1
-        id_list = request.POST.getlist("entry_list")
-        for id in id_list:
-            item = get_object_or_404(Entry, id=id)
-            if not item.position == i:
-                item.position = i
-                item.save()
-            i += 1
+    id_list = request.POST.getlist("entry_list")
+    if id_list:
+        folder.sort_entries(id_list)
+    # render again the entries that were loaded
+    entries, next_cursor = entry_page(folder, size=max(len(id_list), ENTRY_PAGE_SIZE))
     template_name = "funicular_up/htmx/folder_sortable.html"
-    context = {"object": folder}
+    context = {"object": folder, "entries": entries, "next_cursor": next_cursor}
     return TemplateResponse(
         request,
         template_name,
@@ -402,20 +774,15 @@ def search_results_view(request):
     form = ValidateForm(request.GET)
     if form.is_valid():
         q = SearchQuery(request.GET["q"])
-        v = SearchVector("name", "description")
-        # search in folders
-        folders = Folder.objects.all().annotate(rank=SearchRank(v, q))
-        folders = folders.filter(rank__gt=0.01)
-        if folders:
-            folders = folders.order_by("-rank")
-            success = True
-        v = SearchVector("caption")
+        # search in folders, stored vectors are matched through GIN index
+        folders = Folder.objects.filter(search_vector=q)
+        folders = folders.annotate(rank=SearchRank(F("search_vector"), q))
+        folders = list(folders.order_by("-rank")[:SEARCH_LIMIT])
         # search in images
-        images = Entry.objects.all().annotate(rank=SearchRank(v, q))
-        images = images.filter(rank__gt=0.01)
-        if images:
-            images = images.order_by("-rank")
-            success = True
+        images = Entry.objects.filter(search_vector=q).select_related("folder")
+        images = images.annotate(rank=SearchRank(F("search_vector"), q))
+        images = list(images.order_by("-rank")[:SEARCH_LIMIT])
+        success = bool(folders or images)
 
         return TemplateResponse(
             request,
@@ -437,31 +804,301 @@ def search_results_view(request):
         )
 
 
+def typeahead_matches(q):
+    """Top matches of folder names and entry captions for q, found through
+    trigram indexes within TYPEAHEAD_TIMEOUT milliseconds"""
+    if connection.vendor != "postgresql":
+        # trigram matching needs pg_trgm
+        return {}
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute("SET LOCAL statement_timeout = %s", [TYPEAHEAD_TIMEOUT])
+        folders = Folder.objects.filter(name__trigram_word_similar=q)
+        folders = folders.annotate(similarity=TrigramWordSimilarity(q, "name"))
+        folders = folders.order_by("-similarity").values_list("id", "name")
+        images = Entry.objects.filter(caption__trigram_word_similar=q)
+        images = images.annotate(similarity=TrigramWordSimilarity(q, "caption"))
+        images = images.order_by("-similarity").values_list("id", "caption")
+        return {
+            "folders": list(folders[:TYPEAHEAD_LIMIT]),
+            "images": list(images[:TYPEAHEAD_LIMIT]),
+        }
+
+
+def search_typeahead_view(request):
+    """Renders a short list of suggestions while user types in search box"""
+    q = " ".join(request.GET.get("q", "").lower().split())[:100]
+    matches = {}
+    if len(q) >= TYPEAHEAD_MIN_LENGTH:
+        key = "funicular_up_typeahead_" + hashlib.md5(q.encode()).hexdigest()
+        matches = cache.get(key)
+        if matches is None:
+            try:
+                matches = typeahead_matches(q)
+                cache.set(key, matches, TYPEAHEAD_CACHE_TIMEOUT)
+            except OperationalError:
+                # over latency budget, no suggestions this time
+                matches = {}
+    return TemplateResponse(
+        request, "funicular_up/htmx/search_typeahead.html", {"q": q, **matches}
+    )
+
+
+def entry_status_data(entry):
+    return {
+        "url": (
+            reverse("funicular_up:entry_image", kwargs={"pk": entry.id})
+            if entry.image
+            else None
+        ),
+        "status": entry.status,
+    }
+
+
+class EntryImageView(APIView):
+    """Sends the image of the entry to logged in users and to API clients,
+    the transfer is handed to the front-end server if configured, see
+    sendfile module"""
+
+    authentication_classes = (
+        *api_settings.DEFAULT_AUTHENTICATION_CLASSES,
+        SessionAuthentication,
+    )
+    permission_classes = (IsAuthenticated,)
+
+    def perform_content_negotiation(self, request, force=False):
+        # file is sent whatever the client accepts
+        return super().perform_content_negotiation(request, force=True)
+
+    def get(self, request, pk):
+        entry = get_object_or_404(Entry.objects.select_related("image"), id=pk)
+        if not entry.image:
+            raise Http404("Entry without image")
+        try:
+            path = entry.image.file.path
+        except NotImplementedError:
+            # remote storage, nothing to hand over
+            return HttpResponseRedirect(entry.image.url)
+        name = entry.image.original_filename or os.path.basename(path)
+        return serve_file(request, path, name)
+
+
+class RequestAllSerializer(serializers.Serializer):
+    subfolders = serializers.BooleanField(default=True)
+
+
+class FolderRequestAPIView(GenericAPIView):
+    """POST marks downloaded entries of folder and its subfolders as
+    requested, pass subfolders=false to stick to the folder itself"""
+
+    permission_classes = (IsAuthenticated,)
+    serializer_class = RequestAllSerializer
+    queryset = Folder.objects.all()
+
+    def post(self, request, *args, **kwargs):
+        folder = self.get_object()
+        serializer = self.get_serializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=400)
+        requested = folder.request_all(**serializer.validated_data)
+        return Response({"requested": requested})
+
+
 class SendStatus(APIView):
     permission_classes = (IsAuthenticated,)
 
     def get(self, request):
-        entries = Entry.objects.filter(status__in=["UP", "RQ", "KI"])
+        entries = Entry.objects.filter(status__in=PENDING)
         data = {}
-        for entry in entries:
-            data[entry.id] = {
-                "url": entry.image.url,
-                "status": entry.status,
-            }
+        for entry in entries.select_related("image"):
+            data[entry.id] = entry_status_data(entry)
         return Response(data)
 
 
+class StreamQuerySerializer(serializers.Serializer):
+    after = serializers.IntegerField(min_value=0, default=0)
+
+
+class StreamStatus(APIView):
+    """Same entries as SendStatus, streamed in id order as NDJSON lines
+    without building the whole response. An interrupted client resumes
+    passing the last id received as after parameter. Under ASGI use
+    async_stream_status instead"""
+
+    permission_classes = (IsAuthenticated,)
+
+    def get(self, request):
+        query = StreamQuerySerializer(data=request.query_params)
+        if not query.is_valid():
+            return Response(query.errors, status=400)
+        entries = (
+            Entry.objects.filter(
+                status__in=PENDING, id__gt=query.validated_data["after"]
+            )
+            .select_related("image")
+            .order_by("id")
+        )
+
+        def lines():
+            for entry in entries.iterator(chunk_size=STREAM_CHUNK_SIZE):
+                yield json.dumps({"id": entry.id, **entry_status_data(entry)}) + "\n"
+
+        return StreamingHttpResponse(lines(), content_type="application/x-ndjson")
+
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def encode_position(position):
+    modified, id = position
+    return f"{(modified - EPOCH) // timedelta(microseconds=1)}-{id}"
+
+
+def encode_cursor(settled, sent):
+    """Cursor holds positions (modification time in microseconds and id)
+    of the last settled entry and of the last entry sent"""
+    return f"{encode_position(settled)}-{encode_position(sent)}"
+
+
+def decode_cursor(cursor):
+    """Returns settled and sent positions, cursors with a single position
+    come from older versions"""
+    numbers = [int(n) for n in cursor.split("-")]
+    positions = [
+        (EPOCH + timedelta(microseconds=numbers[i]), numbers[i + 1])
+        for i in range(0, len(numbers), 2)
+    ]
+    return positions[0], positions[-1]
+
+
+class ChangesQuerySerializer(serializers.Serializer):
+    cursor = serializers.RegexField(
+        r"^\d{1,20}-\d{1,20}(-\d{1,20}-\d{1,20})?$", required=False
+    )
+    limit = serializers.IntegerField(
+        min_value=1, max_value=CHANGES_MAX_LIMIT, default=CHANGES_LIMIT
+    )
+
+    def validate_cursor(self, value):
+        try:
+            decode_cursor(value)
+        except (OverflowError, ValueError):
+            raise serializers.ValidationError("Invalid cursor")
+        return value
+
+
+def changes_after(cursor, limit):
+    """Entries and deleted entries modified after the settled position of
+    cursor, oldest first, one more than limit of each. Deleted entries
+    keep their id, so both share positions"""
+    entries = Entry.objects.select_related("image").order_by("modified", "id")
+    deleted = DeletedEntry.objects.order_by("modified", "id")
+    if cursor:
+        (modified, id), _ = decode_cursor(cursor)
+        after = Q(modified__gt=modified) | Q(modified=modified, id__gt=id)
+        entries, deleted = entries.filter(after), deleted.filter(after)
+    return entries[: limit + 1], deleted[: limit + 1]
+
+
+def changes_data(entries, deleted, cursor, limit):
+    """Modification times are taken before transactions commit, so a
+    change may become visible after later ones were sent. Entries are
+    sent again until they are older than CHANGES_SETTLE, the cursor only
+    moves past settled ones. Clients may receive an entry more than once"""
+    entries = sorted([*entries, *deleted], key=lambda e: (e.modified, e.id))
+    more = len(entries) > limit
+    entries = entries[:limit]
+    settled, sent = decode_cursor(cursor) if cursor else ((EPOCH, 0), None)
+    horizon = datetime.now(timezone.utc) - CHANGES_SETTLE
+    for entry in entries:
+        position = (entry.modified, entry.id)
+        if entry.modified <= horizon:
+            settled = position
+        if sent is None or position > sent:
+            sent = position
+    return {
+        "entries": {
+            entry.id: entry_status_data(entry)
+            for entry in entries
+            if isinstance(entry, Entry)
+        },
+        "deleted": [entry.id for entry in entries if isinstance(entry, DeletedEntry)],
+        "cursor": encode_cursor(settled, sent) if sent else cursor,
+        # next page starts from the last settled entry
+        "more": more and entries[-1].modified <= horizon,
+    }
+
+
+class SendChanges(APIView):
+    """Sends entries modified after cursor (all entries if no cursor),
+    oldest first, a page at a time, and ids of entries deleted meanwhile.
+    Client polls again with returned cursor, while more is true there are
+    further pages waiting"""
+
+    permission_classes = (IsAuthenticated,)
+
+    def get(self, request):
+        query = ChangesQuerySerializer(data=request.query_params)
+        if not query.is_valid():
+            return Response(query.errors, status=400)
+        cursor = query.validated_data.get("cursor")
+        limit = query.validated_data["limit"]
+        entries, deleted = changes_after(cursor, limit)
+        return Response(changes_data(entries, deleted, cursor, limit))
+
+
 class EntryDownloaded(RetrieveAPIView):
     permission_classes = (IsAuthenticated,)
     queryset = Entry.objects.filter(status__in=["UP", "KI"])
 
     def get(self, request, *args, **kwargs):
         entry = self.get_object()
-        entry.set_as_downloaded()
-        data = {"text": f"Entry {entry.id} deleted on server"}
+        job = entry.set_as_downloaded()
+        if job is None:
+            raise Http404("Entry status changed meanwhile")
+        data = {"text": f"Entry {entry.id} deleted on server", "job": job.id}
         return Response(data)
 
 
+class EntryIdListSerializer(serializers.Serializer):
+    ids = serializers.ListField(
+        child=serializers.IntegerField(), allow_empty=False, max_length=BATCH_MAX_SIZE
+    )
+
+
+class EntriesDownloaded(APIView):
+    """Batch version of EntryDownloaded, POST a list of entry ids"""
+
+    permission_classes = (IsAuthenticated,)
+
+    def post(self, request):
+        serializer = EntryIdListSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=400)
+        ids = set(serializer.validated_data["ids"])
+        updated, job = Entry.set_many_as_downloaded(ids)
+        results = {id: "downloaded" for id in updated}
+        others = Entry.objects.filter(id__in=ids.difference(updated))
+        for id, status in others.values_list("id", "status"):
+            results[id] = f"not downloadable, status {status}"
+        for id in ids.difference(results):
+            results[id] = "not found"
+        data = {"results": results, "job": job.id if job else None}
+        return Response(data)
+
+
+class JobSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Job
+        fields = ("id", "task", "status", "progress", "error", "modified")
+
+
+class JobDetailAPIView(RetrieveAPIView):
+    permission_classes = (IsAuthenticated,)
+    serializer_class = JobSerializer
+    queryset = Job.objects.all()
+
+
 class ImageUploadSerializer(serializers.Serializer):
     image = serializers.ImageField()
 
@@ -477,12 +1114,335 @@ class EntryUpdateAPIView(UpdateAPIView):
         serializer = ImageUploadSerializer(data=request.data)
         if serializer.is_valid():
             img = serializer.validated_data["image"]
-            entry.image.file.delete()
-            entry.image.file.save(img.name, img)
-            entry.status = "ST"
-            entry.save()
+            if not entry.restore_image(img, img.name):
+                raise Http404("No Entry matches the given query.")
             r_data = {"text": f"Entry {entry.id} restored on server"}
             return Response(r_data)
         else:
             r_data = serializer.errors
             return Response(r_data)
+
+
+class UploadSerializer(serializers.ModelSerializer):
+    checksum = serializers.RegexField(r"^[0-9a-f]{64}$")
+
+    class Meta:
+        model = Upload
+        fields = ("id", "name", "size", "checksum", "offset")
+        read_only_fields = ("offset",)
+
+
+class UploadStartAPIView(CreateAPIView):
+    """Starts a resumable restore of a requested entry. Starting again
+    with the same size and checksum resumes the pending upload"""
+
+    permission_classes = (IsAuthenticated,)
+    serializer_class = UploadSerializer
+    queryset = Entry.objects.filter(status="RQ")
+
+    def create(self, request, *args, **kwargs):
+        entry = self.get_object()
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        upload = entry.upload_set.filter(
+            size=serializer.validated_data["size"],
+            checksum=serializer.validated_data["checksum"],
+        ).first()
+        if upload:
+            return Response(UploadSerializer(upload).data)
+        upload = serializer.save(entry=entry)
+        return Response(UploadSerializer(upload).data, status=201)
+
+
+class BlobSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Blob
+        fields = ("digest", "created")
+
+
+class RestoreDigestAPIView(RetrieveAPIView):
+    """Lets the sync client skip restore uploads of contents already on
+    server. GET (or HEAD) answers 404 if no blob has the SHA-1 digest of
+    the original, POST links the requested entry to the blob"""
+
+    permission_classes = (IsAuthenticated,)
+    serializer_class = BlobSerializer
+    queryset = Entry.objects.filter(status="RQ")
+
+    def get_blob(self):
+        return get_object_or_404(
+            Blob.objects.select_related("image"), digest=self.kwargs["digest"]
+        )
+
+    def get(self, request, *args, **kwargs):
+        self.get_object()
+        return Response(BlobSerializer(self.get_blob()).data)
+
+    def post(self, request, *args, **kwargs):
+        entry = self.get_object()
+        try:
+            linked = entry.link_image(self.get_blob().image)
+        except Blob.DoesNotExist:
+            linked = False
+        if not linked:
+            # restored or downscaled meanwhile
+            raise Http404("No Blob matches the given query.")
+        r_data = {"text": f"Entry {entry.id} restored on server"}
+        return Response(r_data)
+
+
+CONTENT_RANGE = re.compile(r"^bytes (\d+)-(\d+)/(\d+)$")
+
+
+class UploadChunkAPIView(RetrieveAPIView):
+    """GET returns bytes received so far, PUT appends a chunk sent as raw
+    body with a Content-Range header starting at that offset"""
+
+    permission_classes = (IsAuthenticated,)
+    serializer_class = UploadSerializer
+    queryset = Upload.objects.filter(entry__status="RQ")
+
+    def put(self, request, *args, **kwargs):
+        match = CONTENT_RANGE.match(request.headers.get("Content-Range", ""))
+        if not match:
+            return Response({"detail": "Invalid Content-Range header"}, status=400)
+        start, end, total = (int(g) for g in match.groups())
+        upload = self.get_object()
+        if total != upload.size or end < start or end >= total:
+            return Response({"detail": "Invalid Content-Range"}, status=400)
+        length = end - start + 1
+        written = upload.write_chunk(start, request.stream or BytesIO(), length)
+        if written is None:
+            # not at the offset reached, or another chunk is being written
+            upload.refresh_from_db()
+            return Response(UploadSerializer(upload).data, status=409)
+        if written != length:
+            return Response(
+                {
+                    "detail": "Chunk shorter than Content-Range",
+                    **UploadSerializer(upload).data,
+                },
+                status=400,
+            )
+        return Response(UploadSerializer(upload).data)
+
+
+class UploadFinalizeAPIView(RetrieveAPIView):
+    """Checks and swaps assembled upload, entry moves from RQ to ST"""
+
+    permission_classes = (IsAuthenticated,)
+    serializer_class = UploadSerializer
+    queryset = Upload.objects.filter(entry__status="RQ")
+
+    def post(self, request, *args, **kwargs):
+        upload = self.get_object()
+        try:
+            upload.finalize()
+        except ValidationError as e:
+            return Response({"detail": e.messages}, status=400)
+        r_data = {"text": f"Entry {upload.entry.id} restored on server"}
+        return Response(r_data)
+
+
+# Async versions of sync client endpoints, run under ASGI they don't hold
+# a thread while waiting
+
+
+@sync_to_async
+def authenticate(request):
+    """Runs DRF authentication classes, returns user or None"""
+    authenticators = [auth() for auth in api_settings.DEFAULT_AUTHENTICATION_CLASSES]
+    try:
+        user = Request(request, authenticators=authenticators).user
+    except AuthenticationFailed:
+        return None
+    return user if user.is_authenticated else None
+
+
+def async_api_view(view):
+    """Authenticates like DRF views with IsAuthenticated permission"""
+
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        request.user = await authenticate(request)
+        if request.user is None:
+            return JsonResponse(
+                {"detail": "Authentication credentials were not provided."},
+                status=401,
+            )
+        return await view(request, *args, **kwargs)
+
+    # as DRF views, no session is involved
+    return csrf_exempt(wrapper)
+
+
+async def achanges(cursor, limit):
+    entries, deleted = changes_after(cursor, limit)
+    entries = [entry async for entry in entries]
+    deleted = [entry async for entry in deleted]
+    return changes_data(entries, deleted, cursor, limit)
+
+
+@async_api_view
+async def async_send_status(request):
+    """Same as SendStatus"""
+    if request.method != "GET":
+        return HttpResponseNotAllowed(["GET"])
+    entries = Entry.objects.filter(status__in=PENDING)
+    data = {
+        entry.id: entry_status_data(entry)
+        async for entry in entries.select_related("image")
+    }
+    return JsonResponse(data)
+
+
+@async_api_view
+async def async_stream_status(request):
+    """Same as StreamStatus: under ASGI, streaming responses are iterated
+    asynchronously, a sync generator would be read whole in memory"""
+    if request.method != "GET":
+        return HttpResponseNotAllowed(["GET"])
+    query = StreamQuerySerializer(data=request.GET)
+    if not query.is_valid():
+        return JsonResponse(query.errors, status=400)
+    entries = (
+        Entry.objects.filter(status__in=PENDING, id__gt=query.validated_data["after"])
+        .select_related("image")
+        .order_by("id")
+    )
+
+    async def lines():
+        async for entry in entries.aiterator(chunk_size=STREAM_CHUNK_SIZE):
+            yield json.dumps({"id": entry.id, **entry_status_data(entry)}) + "\n"
+
+    return StreamingHttpResponse(lines(), content_type="application/x-ndjson")
+
+
+class WaitQuerySerializer(ChangesQuerySerializer):
+    timeout = serializers.IntegerField(
+        min_value=0, max_value=WAIT_MAX_TIMEOUT, default=WAIT_TIMEOUT
+    )
+
+
+async def stream_changes(cursor, limit):
+    """Server-Sent Events: a changes event for each page of changes,
+    comments keep the connection alive meanwhile"""
+    broker = get_broker()
+    while True:
+        event = broker.subscribe()
+        data = await achanges(cursor, limit)
+        if data["cursor"] != cursor:
+            cursor = data["cursor"]
+            yield f"id: {cursor}\nevent: changes\ndata: {json.dumps(data)}\n\n"
+        elif not await broker.wait(event, SSE_KEEPALIVE):
+            yield ": keepalive\n\n"
+
+
+@async_api_view
+async def wait_changes_view(request):
+    """Long-poll version of SendChanges: answers as soon as entries change
+    after cursor, or with no entries after timeout seconds. Clients that
+    accept text/event-stream get a stream of changes instead, resumed from
+    Last-Event-ID when reconnecting"""
+    if request.method != "GET":
+        return HttpResponseNotAllowed(["GET"])
+    params = request.GET.copy()
+    if "cursor" not in params and "Last-Event-ID" in request.headers:
+        params["cursor"] = request.headers["Last-Event-ID"]
+    query = WaitQuerySerializer(data=params)
+    if not query.is_valid():
+        return JsonResponse(query.errors, status=400)
+    cursor = query.validated_data.get("cursor")
+    limit = query.validated_data["limit"]
+    if "text/event-stream" in request.headers.get("Accept", ""):
+        response = StreamingHttpResponse(
+            stream_changes(cursor, limit), content_type="text/event-stream"
+        )
+        response["Cache-Control"] = "no-cache"
+        # no buffering by nginx
+        response["X-Accel-Buffering"] = "no"
+        return response
+    broker = get_broker()
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + query.validated_data["timeout"]
+    while True:
+        event = broker.subscribe()
+        data = await achanges(cursor, limit)
+        remaining = deadline - loop.time()
+        # entries sent again until settled don't count as changes
+        if data["cursor"] != cursor or remaining <= 0:
+            return JsonResponse(data)
+        await broker.wait(event, remaining)
+
+
+async def relay_notifications():
+    """Server-Sent Events: a status event with the entries of each
+    notification, comments keep the connection alive meanwhile"""
+    broker = get_broker()
+    queue = broker.add_queue()
+    try:
+        while True:
+            try:
+                ids = await asyncio.wait_for(queue.get(), SSE_KEEPALIVE)
+            except asyncio.TimeoutError:
+                yield ": keepalive\n\n"
+                continue
+            if not ids:
+                continue
+            entries = Entry.objects.filter(id__in=ids).select_related("image")
+            data = {entry.id: entry_status_data(entry) async for entry in entries}
+            yield f"event: status\ndata: {json.dumps(data)}\n\n"
+    finally:
+        broker.remove_queue(queue)
+
+
+@async_api_view
+async def notifications_view(request):
+    """Relays status transitions to sync clients as they happen. Clients
+    first catch up with status/changes/, then listen here"""
+    if request.method != "GET":
+        return HttpResponseNotAllowed(["GET"])
+    response = StreamingHttpResponse(
+        relay_notifications(), content_type="text/event-stream"
+    )
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"
+    return response
+
+
+@async_api_view
+async def async_entry_downloaded(request, pk):
+    """Same as EntryDownloaded"""
+    if request.method != "GET":
+        return HttpResponseNotAllowed(["GET"])
+    updated, job = await sync_to_async(Entry.set_many_as_downloaded)([pk])
+    if not updated:
+        raise Http404("No Entry matches the given query.")
+    data = {"text": f"Entry {pk} deleted on server", "job": job.id}
+    return JsonResponse(data)
+
+
+@sync_to_async
+def restore_upload(request, entry):
+    """Parses and checks the uploaded image, then stores it"""
+    _, files = request.parse_file_upload(request.META, request)
+    serializer = ImageUploadSerializer(data=files)
+    if not serializer.is_valid():
+        return serializer.errors
+    img = serializer.validated_data["image"]
+    if not entry.restore_image(img, img.name):
+        raise Http404("No Entry matches the given query.")
+    return {"text": f"Entry {entry.id} restored on server"}
+
+
+@async_api_view
+async def async_entry_upload(request, pk):
+    """Same as EntryUpdateAPIView, PUT the image as multipart form data"""
+    if request.method != "PUT":
+        return HttpResponseNotAllowed(["PUT"])
+    entry = (
+        await Entry.objects.filter(id=pk, status="RQ").select_related("image").afirst()
+    )
+    if entry is None:
+        raise Http404("No Entry matches the given query.")
+    return JsonResponse(await restore_upload(request, entry))